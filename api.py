@@ -0,0 +1,333 @@
+import hmac
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Blueprint, current_app, request
+from sqlalchemy import func
+
+from cache import cache
+from models import db, Venue, Artist, Show
+from pagination import show_filters, decode_cursor, page_shows
+
+#----------------------------------------------------------------------------#
+# JSON API, version 1.
+#
+# Every list endpoint takes `fields=` (a comma separated sparse fieldset), `limit=`
+# and `cursor=`; the next page's cursor comes back as `next_cursor`. Only the
+# requested columns are selected and rows are serialized straight from the
+# result tuples, no ORM objects are built.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = {
+  'id': Venue.id,
+  'name': Venue.name,
+  'genres': Venue.genres,
+  'address': Venue.address,
+  'city': Venue.city,
+  'state': Venue.state,
+  'phone': Venue.phone,
+  'website': Venue.website,
+  'facebook_link': Venue.facebook_link,
+  'seeking_talent': Venue.seeking,
+  'seeking_description': Venue.seeking_desc,
+  'image_link': Venue.image_link,
+  'upcoming_show_count': Venue.upcoming_show_count,
+  'past_show_count': Venue.past_show_count,
+  'updated_at': Venue.updated_at,
+}
+
+ARTIST_FIELDS = {
+  'id': Artist.id,
+  'name': Artist.name,
+  'genres': Artist.genres,
+  'city': Artist.city,
+  'state': Artist.state,
+  'phone': Artist.phone,
+  'website': Artist.website,
+  'facebook_link': Artist.facebook_link,
+  'seeking_venue': Artist.seeking,
+  'seeking_description': Artist.seeking_desc,
+  'image_link': Artist.image_link,
+  'upcoming_show_count': Artist.upcoming_show_count,
+  'past_show_count': Artist.past_show_count,
+  'updated_at': Artist.updated_at,
+}
+
+SHOW_FIELDS = {
+  'id': Show.id,
+  'start_time': Show.dt,
+  'duration': Show.duration,
+  'venue_id': Show.venue_id,
+  'venue_name': Venue.name,
+  'venue_image_link': Venue.image_link,
+  'artist_id': Show.artist_id,
+  'artist_name': Artist.name,
+  'artist_image_link': Artist.image_link,
+  'updated_at': Show.updated_at,
+}
+
+# the shows embedded in a venue/artist detail response
+SHOW_LIST_FIELDS = ('past_shows', 'upcoming_shows')
+
+DEFAULT_FIELDS = ('id', 'name')
+DEFAULT_SHOW_FIELDS = ('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name')
+
+
+class ApiError(Exception):
+
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+    self.message = message
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+  return json_response({'error': error.message}, error.status)
+
+
+def token_required(view):
+  # write and bulk endpoints need `Authorization: Bearer <token>` with one of API_TOKENS
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    tokens = current_app.config['API_TOKENS']
+    if scheme.lower() != 'bearer' or not any(hmac.compare_digest(token.strip(), valid) for valid in tokens):
+      raise ApiError(401, 'A valid API token is required')
+    return view(*args, **kwargs)
+  return wrapper
+
+
+def json_response(payload, status=200):
+  return current_app.response_class(
+    json.dumps(payload, default=serialize, separators=(',', ':')),
+    status=status,
+    mimetype='application/json'
+  )
+
+
+def serialize(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def requested_fields(available, default, extra=()):
+  fields = request.args.get('fields')
+  if not fields:
+    return list(default)
+  fields = [field.strip() for field in fields.split(',') if field.strip()]
+  unknown = [field for field in fields if field not in available and field not in extra]
+  if unknown:
+    raise ApiError(400, f"Unknown fields: {', '.join(unknown)}")
+  return fields
+
+
+def page_size():
+  limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+  return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def rows_to_dicts(fields, rows):
+  return [dict(zip(fields, row)) for row in rows]
+
+#----------------------------------------------------------------------------#
+# Venues and artists.
+#----------------------------------------------------------------------------#
+
+def list_entities(model, available):
+  # keyset pagination on id, the cursor is the id of the last row of the page
+  fields = requested_fields(available, DEFAULT_FIELDS)
+  limit = page_size()
+  try:
+    cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+  except ValueError:
+    raise ApiError(400, 'Malformed cursor')
+  # the id is always selected, it is needed for the next cursor
+  columns = [available[field] for field in fields] + [model.id]
+
+  query = db.session.query(*columns)
+  if cursor is not None:
+    query = query.filter(model.id > cursor)
+  genre = request.args.get('genre')
+  if genre:
+    query = query.filter(model.genres.contains([genre]))
+  rows = query.order_by(model.id).limit(limit + 1).all()
+
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = str(rows[-1][-1])
+  return json_response({
+    'data': rows_to_dicts(fields, rows),
+    'next_cursor': next_cursor
+  })
+
+
+def show_entity(model, available, entity_id, show_fk, counterpart, counterpart_fk, prefix):
+  fields = requested_fields(available, list(available) + list(SHOW_LIST_FIELDS), SHOW_LIST_FIELDS)
+  names = [field for field in fields if field in available]
+  row = db.session.query(
+    model.id, *[available[field] for field in names]
+  ).filter(
+    model.id == entity_id
+  ).first()
+  if row is None:
+    raise ApiError(404, f'{model.__name__} with ID {entity_id} does not exist')
+  data = dict(zip(names, row[1:]))
+
+  if any(field in SHOW_LIST_FIELDS for field in fields):
+    now = datetime.now()
+    shows = db.session.query(
+      Show.id,
+      Show.dt,
+      counterpart.id,
+      counterpart.name,
+      counterpart.image_link,
+      (Show.dt > now).label('upcoming')
+    ).join(
+      counterpart, counterpart.id == counterpart_fk
+    ).filter(
+      show_fk == entity_id
+    ).order_by(
+      Show.dt, Show.id
+    ).all()
+    split = {'past_shows': [], 'upcoming_shows': []}
+    for show in shows:
+      split['upcoming_shows' if show.upcoming else 'past_shows'].append({
+        'id': show[0],
+        'start_time': show[1],
+        f'{prefix}_id': show[2],
+        f'{prefix}_name': show[3],
+        f'{prefix}_image_link': show[4]
+      })
+    for field in SHOW_LIST_FIELDS:
+      if field in fields:
+        data[field] = split[field]
+  return json_response({'data': data})
+
+
+def availability(model, entity_id, show_fk):
+  # ?start= (ISO 8601) and ?duration= (minutes, default 120). the overlap test on
+  # (venue_id|artist_id, slot) is served by the GiST index of the exclusion constraint
+  try:
+    start = datetime.fromisoformat(request.args['start'])
+  except (KeyError, ValueError):
+    raise ApiError(400, 'start must be an ISO 8601 date and time')
+  if start.tzinfo is not None:
+    # show times are naive local times
+    start = start.astimezone().replace(tzinfo=None)
+  duration = request.args.get('duration', 120, type=int)
+  if duration <= 0:
+    raise ApiError(400, 'duration must be a positive number of minutes')
+  end = start + timedelta(minutes=duration)
+
+  if db.session.query(model.id).filter(model.id == entity_id).first() is None:
+    raise ApiError(404, f'{model.__name__} with ID {entity_id} does not exist')
+  conflicts = db.session.query(
+    Show.id, Show.dt, Show.duration
+  ).filter(
+    show_fk == entity_id,
+    Show.slot.overlaps(func.tsrange(start, end))
+  ).order_by(
+    Show.dt
+  ).all()
+  return json_response({'data': {
+    'start_time': start,
+    'end_time': end,
+    'available': not conflicts,
+    'conflicts': [
+      {'id': id, 'start_time': dt, 'end_time': dt + timedelta(minutes=minutes)} for id, dt, minutes in conflicts
+    ]
+  }})
+
+
+@api.route('/venues')
+@cache.cached('venues')
+def venues():
+  return list_entities(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/<int:venue_id>')
+@cache.cached('venues', 'shows', 'artists')
+def venue(venue_id):
+  return show_entity(Venue, VENUE_FIELDS, venue_id, Show.venue_id, Artist, Show.artist_id, 'artist')
+
+
+@api.route('/artists')
+@cache.cached('artists')
+def artists():
+  return list_entities(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/<int:artist_id>')
+@cache.cached('artists', 'shows', 'venues')
+def artist(artist_id):
+  return show_entity(Artist, ARTIST_FIELDS, artist_id, Show.artist_id, Venue, Show.venue_id, 'venue')
+
+
+@api.route('/venues/<int:venue_id>/availability')
+@cache.cached('venues', 'shows')
+def venue_availability(venue_id):
+  return availability(Venue, venue_id, Show.venue_id)
+
+
+@api.route('/artists/<int:artist_id>/availability')
+@cache.cached('artists', 'shows')
+def artist_availability(artist_id):
+  return availability(Artist, artist_id, Show.artist_id)
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+@api.route('/shows')
+@cache.cached('shows', 'venues', 'artists')
+def shows():
+  # keyset pagination on (start_time, id), same filters as the /shows page
+  fields = requested_fields(SHOW_FIELDS, DEFAULT_SHOW_FIELDS)
+  try:
+    after = decode_cursor(request.args.get('cursor'))
+  except ValueError:
+    raise ApiError(400, 'Malformed cursor')
+
+  # Show.dt and Show.id are always selected, they are needed for the next cursor
+  columns = [SHOW_FIELDS[field] for field in fields]
+  query = db.session.query(*columns, Show.dt, Show.id)
+  if any(column.class_ is Venue for column in columns):
+    query = query.join(Venue, Venue.id == Show.venue_id)
+  if any(column.class_ is Artist for column in columns):
+    query = query.join(Artist, Artist.id == Show.artist_id)
+  for fk in ('venue_id', 'artist_id'):
+    value = request.args.get(fk, type=int)
+    if value is not None:
+      query = query.filter(SHOW_FIELDS[fk] == value)
+  rows, next_cursor = page_shows(query, show_filters(request.args), after, page_size())
+
+  return json_response({
+    'data': rows_to_dicts(fields, rows),
+    'next_cursor': next_cursor
+  })
+
+
+@api.route('/shows/<int:show_id>')
+@cache.cached('shows', 'venues', 'artists')
+def show(show_id):
+  fields = requested_fields(SHOW_FIELDS, list(SHOW_FIELDS))
+  row = db.session.query(
+    *[SHOW_FIELDS[field] for field in fields]
+  ).select_from(
+    Show
+  ).join(
+    Venue, Venue.id == Show.venue_id
+  ).join(
+    Artist, Artist.id == Show.artist_id
+  ).filter(
+    Show.id == show_id
+  ).first()
+  if row is None:
+    raise ApiError(404, f'Show with ID {show_id} does not exist')
+  return json_response({'data': dict(zip(fields, row))})
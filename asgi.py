@@ -0,0 +1,388 @@
+#----------------------------------------------------------------------------#
+# Async read path.
+#
+# The hot read pages of app.py (venues, artists, shows, the venue and artist
+# pages, the venue and artist searches) served by Quart on an asyncpg pool, so a
+# worker waiting on postgres keeps serving other requests instead of blocking a
+# thread. Flask 1.1 has no async views and SQLAlchemy 1.3 no asyncio support,
+# hence a separate ASGI app. Its statements are SQLAlchemy Core selects on the
+# models' tables, each one mirrors the query of a sync view and names it: change
+# them together. It renders the same templates and builds the same URLs, writes
+# and the remaining pages stay on the WSGI app: route GET requests for the paths
+# below to this app at the proxy.
+#
+#   pip install quart asyncpg hypercorn
+#   FYYUR_CONFIG=production hypercorn --workers 4 'asgi:create_async_app()'
+#----------------------------------------------------------------------------#
+
+import asyncio
+import re
+import time
+from datetime import datetime
+from itertools import groupby
+
+import asyncpg
+from quart import Quart, Blueprint, current_app, g, render_template, request, flash, redirect, url_for, abort
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from config import get_config
+from app import format_datetime, format_datetimes, escape_like
+from models import Venue, Artist, Show
+from pagination import show_filters, show_conditions, decode_cursor, encode_cursor, PageWithoutCount
+from cache import init_fragment_cache
+from templating import init_templates
+
+bp = Blueprint('main', __name__)
+
+def create_async_app(config=None):
+  # same profiles as create_app()
+  app = Quart(__name__)
+  app.config.from_object(get_config(config))
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.register_blueprint(bp)
+  init_fragment_cache(app)
+  init_templates(app)
+
+  @app.before_serving
+  async def open_pool():
+    app.pool = await create_pool(app.config)
+
+  @app.after_serving
+  async def close_pool():
+    await app.pool.close()
+
+  if app.config.get('METRICS_ENABLED', True):
+    app.before_request(start_timing)
+    app.after_request(server_timing)
+
+  return app
+
+def create_pool(config):
+  # sized like the SQLAlchemy pool of a sync worker: pool_size connections kept
+  # open, up to pool_size + max_overflow under load
+  options = config['SQLALCHEMY_ENGINE_OPTIONS']
+  pool_size = options.get('pool_size', 5)
+  server_settings = {}
+  # the same setting as the sync engine's connect_args
+  statement_timeout = config['DB_STATEMENT_TIMEOUT_MS']
+  if statement_timeout:
+    server_settings['statement_timeout'] = str(statement_timeout)
+  # asyncpg takes plain postgres URLs, without a SQLAlchemy driver name
+  dsn = re.sub(r'^postgres(ql)?(\+\w+)?://', 'postgresql://', config['SQLALCHEMY_DATABASE_URI'])
+  return asyncpg.create_pool(
+    dsn,
+    min_size=pool_size,
+    max_size=pool_size + options.get('max_overflow', 10),
+    max_inactive_connection_lifetime=options.get('pool_recycle', 1800),
+    server_settings=server_settings
+  )
+
+#----------------------------------------------------------------------------#
+# Timing.
+#----------------------------------------------------------------------------#
+
+async def start_timing():
+  g.request_metrics = {'start': time.perf_counter(), 'queries': 0, 'sql_time': 0.0}
+
+async def server_timing(response):
+  # the same Server-Timing header as the sync app (without the template time), so
+  # benchmarks/run.py reads both. statements run concurrently, sql is their total time
+  current = g.pop('request_metrics', None)
+  if current is not None:
+    elapsed = time.perf_counter() - current['start']
+    response.headers['Server-Timing'] = ', '.join((
+      f"sql;dur={current['sql_time'] * 1000:.1f};desc=\"{current['queries']} queries\"",
+      f'total;dur={elapsed * 1000:.1f}',
+    ))
+  return response
+
+#----------------------------------------------------------------------------#
+# Statements.
+#
+# SQLAlchemy 1.3 has no asyncpg dialect: statements are compiled by the postgres
+# one with numbered placeholders, renamed to asyncpg's $1, $2, ...
+#----------------------------------------------------------------------------#
+
+DIALECT = postgresql.dialect(paramstyle='numeric')
+
+def compile_statement(statement):
+  # (sql, positional arguments) of a Core statement, for asyncpg
+  compiled = statement.compile(dialect=DIALECT)
+  params = compiled.construct_params()
+  return re.sub(r':(\d+)', r'$\1', compiled.string), [params[name] for name in compiled.positiontup]
+
+async def query(method, statement):
+  # runs `statement` with pool.fetch/fetchrow/fetchval. every call checks out a
+  # connection of its own, so calls gathered together run at the same time
+  sql, args = compile_statement(statement)
+  start = time.perf_counter()
+  try:
+    return await getattr(current_app.pool, method)(sql, *args)
+  finally:
+    current = g.get('request_metrics')
+    if current is not None:
+      current['queries'] += 1
+      current['sql_time'] += time.perf_counter() - start
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+async def search_by_name(model, search_term, page=1):
+  # mirrors app.search_by_name. postgres escapes LIKE patterns with a backslash by
+  # default, as escape_like expects
+  per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+  page = max(page, 1)
+  rows = await query('fetch', select([
+    model.id,
+    model.name,
+    model.upcoming_show_count.label('num_upcoming_shows')
+  ]).where(
+    model.name.ilike('%' + escape_like(search_term) + '%')
+  ).order_by(
+    model.name, model.id
+  ).limit(per_page + 1).offset((page - 1) * per_page))
+
+  pagination = PageWithoutCount(page, per_page, rows)
+  return {
+    'count': pagination.total,
+    'data': [
+      {
+        'id': row['id'],
+        'name': row['name'],
+        'num_upcoming_shows': row['num_upcoming_shows']
+      } for row in pagination.items
+    ],
+    'pagination': pagination
+  }
+
+# kind: (model, its show fk, the other side of its shows, their fk, prefix of the other side)
+DETAILS = {
+  'venue': (Venue, Show.venue_id, Artist, Show.artist_id, 'artist'),
+  'artist': (Artist, Show.artist_id, Venue, Show.venue_id, 'venue'),
+}
+
+def detail_columns(model):
+  # what detail_page reads, venues add their address
+  columns = [model.id, model.name, model.genres, model.city, model.state, model.phone, model.website,
+             model.facebook_link, model.seeking, model.seeking_desc, model.image_link]
+  return columns + [Venue.address] if model is Venue else columns
+
+def shows_of(show_fk, entity_id, counterpart, counterpart_fk, condition):
+  # mirrors app.load_shows, which reads past and upcoming shows in one query
+  return select([
+    Show.id.label('show_id'),
+    Show.dt,
+    Show.updated_at,
+    counterpart.id,
+    counterpart.name,
+    counterpart.image_link,
+    counterpart.updated_at.label('counterpart_updated_at')
+  ]).select_from(
+    Show.__table__.join(counterpart.__table__, counterpart.id == counterpart_fk)
+  ).where(
+    (show_fk == entity_id) & condition
+  ).order_by(
+    Show.dt, Show.id
+  )
+
+async def load_detail(kind, entity_id):
+  # the venue/artist row (mirrors the Model.query.get of app.show_venue and
+  # app.show_artist), its past shows and its upcoming shows as three concurrent
+  # queries, each one an index lookup. returns (row, shows), row is None for an unknown id
+  model, show_fk, counterpart, counterpart_fk, prefix = DETAILS[kind]
+  now = datetime.now()
+  row, past, upcoming = await asyncio.gather(
+    query('fetchrow', select(detail_columns(model)).where(model.id == entity_id)),
+    query('fetch', shows_of(show_fk, entity_id, counterpart, counterpart_fk, Show.dt <= now)),
+    query('fetch', shows_of(show_fk, entity_id, counterpart, counterpart_fk, Show.dt > now))
+  )
+
+  shows = {}
+  for key, rows in (('past_shows', past), ('upcoming_shows', upcoming)):
+    start_times = format_datetimes([show['dt'] for show in rows], 'full')
+    shows[key] = [
+      {
+        'id': show['show_id'],
+        'updated_at': show['updated_at'],
+        f'{prefix}_id': show['id'],
+        f'{prefix}_name': show['name'],
+        f'{prefix}_image_link': show['image_link'],
+        f'{prefix}_updated_at': show['counterpart_updated_at'],
+        'start_time': show['dt'],
+        'start_time_formatted': start_time
+      } for show, start_time in zip(rows, start_times)
+    ]
+  return row, shows
+
+def detail_page(row, shows):
+  # the fields show_venue.html and show_artist.html have in common
+  return {
+    "id": row['id'],
+    "name": row['name'],
+    "genres": row['genres'] or [],
+    "city": row['city'],
+    "state": row['state'],
+    "phone": row['phone'],
+    "website": row['website'],
+    "facebook_link": row['facebook_link'],
+    "seeking_talent": row['seeking'],
+    "seeking_description": row['seeking_desc'],
+    "image_link": row['image_link'],
+    "past_shows": shows['past_shows'],
+    "upcoming_shows": shows['upcoming_shows'],
+    "past_shows_count": len(shows['past_shows']),
+    "upcoming_shows_count": len(shows['upcoming_shows']),
+  }
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@bp.route('/venues')
+async def venues():
+  # mirrors app.venues
+  genre = request.args.get('genre')
+  statement = select([
+    Venue.city,
+    Venue.state,
+    Venue.id,
+    Venue.name,
+    Venue.upcoming_show_count.label('num_upcoming_shows')
+  ])
+  if genre:
+    statement = statement.where(Venue.genres.contains([genre]))
+  rows = await query('fetch', statement.order_by(Venue.city, Venue.state, Venue.name))
+
+  areas = []
+  for (city, state), group in groupby(rows, key=lambda row: (row['city'], row['state'])):
+    areas.append(
+      {
+        'city': city,
+        'state': state,
+        'venues': [
+          {
+            'id': row['id'],
+            'name': row['name'],
+            'num_upcoming_shows': row['num_upcoming_shows']
+          } for row in group
+        ]
+      }
+    )
+  return await render_template('pages/venues.html', areas=areas, genre=genre)
+
+@bp.route('/venues/search', methods=['GET', 'POST'])
+async def search_venues():
+  values = await request.values
+  search_term = values.get('search_term', '')
+  response = await search_by_name(Venue, search_term, values.get('page', 1, type=int))
+  return await render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@bp.route('/venues/<int:venue_id>')
+async def show_venue(venue_id):
+  row, shows = await load_detail('venue', venue_id)
+  if row is None:
+    await flash(f"Venue with ID {venue_id} does not exist")
+    return redirect(url_for('main.venues'))
+  venue = detail_page(row, shows)
+  venue['address'] = row['address']
+  return await render_template('pages/show_venue.html', venue=venue)
+
+@bp.route('/artists')
+async def artists():
+  # mirrors app.artists
+  rows = await query('fetch', select([Artist.id, Artist.name]))
+  data = [{'id': row['id'], 'name': row['name']} for row in rows]
+  return await render_template('pages/artists.html', artists=data)
+
+@bp.route('/artists/search', methods=['GET', 'POST'])
+async def search_artists():
+  values = await request.values
+  search_term = values.get('search_term', '')
+  response = await search_by_name(Artist, search_term, values.get('page', 1, type=int))
+  return await render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@bp.route('/artists/<int:artist_id>')
+async def show_artist(artist_id):
+  row, shows = await load_detail('artist', artist_id)
+  if row is None:
+    await flash(f'Artist with ID {artist_id} does not exist')
+    return redirect(url_for('main.artists'))
+  return await render_template('pages/show_artist.html', artist=detail_page(row, shows))
+
+@bp.route('/shows')
+async def shows():
+  # mirrors app.shows, one keyset page ordered by (dt, id), see pagination.page_shows
+  per_page = current_app.config['SHOWS_PER_PAGE']
+  filters = show_filters(request.args)
+  try:
+    after = decode_cursor(request.args.get('after'))
+  except ValueError:
+    abort(400)
+
+  statement = select([
+    Show.id,
+    Show.dt,
+    Show.updated_at,
+    Venue.id.label('venue_id'),
+    Venue.name.label('venue_name'),
+    Venue.updated_at.label('venue_updated_at'),
+    Artist.id.label('artist_id'),
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Artist.updated_at.label('artist_updated_at')
+  ]).select_from(
+    Show.__table__.join(Venue.__table__, Venue.id == Show.venue_id).join(Artist.__table__, Artist.id == Show.artist_id)
+  )
+  for condition in show_conditions(filters, after):
+    statement = statement.where(condition)
+  rows = await query('fetch', statement.order_by(Show.dt, Show.id).limit(per_page + 1))
+
+  next_url = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    link_args = {key: value for key, value in request.args.items() if key != 'after'}
+    next_url = url_for('main.shows', after=encode_cursor(rows[-1]['dt'], rows[-1]['id']), **link_args)
+
+  data = []
+  start_times = format_datetimes([row['dt'] for row in rows], 'full')
+  for row, start_time in zip(rows, start_times):
+    data.append({
+      'id': row['id'],
+      'updated_at': row['updated_at'],
+      'venue_id': row['venue_id'],
+      'venue_name': row['venue_name'],
+      'venue_updated_at': row['venue_updated_at'],
+      'artist_id': row['artist_id'],
+      'artist_name': row['artist_name'],
+      'artist_image_link': row['artist_image_link'],
+      'artist_updated_at': row['artist_updated_at'],
+      'start_time': row['dt'],
+      'start_time_formatted': start_time
+    })
+  # the template calls next_url(), the sync view only knows it after the last row
+  return await render_template('pages/shows.html', shows=data, filters=filters, next_url=lambda: next_url)
+
+# pages the templates link to that only the sync app serves. the rules are here so
+# url_for() can build them, the proxy sends their requests to the sync app
+SYNC_ONLY = (
+  ('/', 'index'),
+  ('/search', 'search'),
+  ('/venues/<int:venue_id>/calendar', 'venue_calendar'),
+  ('/artists/<int:artist_id>/calendar', 'artist_calendar'),
+)
+
+async def served_by_sync_app(**kwargs):
+  abort(404)
+
+for rule, endpoint in SYNC_ONLY:
+  bp.add_url_rule(rule, endpoint, served_by_sync_app)
+
+@bp.app_errorhandler(404)
+async def not_found_error(error):
+  return await render_template('errors/404.html'), 404
+
+@bp.app_errorhandler(500)
+async def server_error(error):
+  return await render_template('errors/500.html'), 500
@@ -0,0 +1,96 @@
+"""Prints the query plans of the show time window queries with and without the
+shows indexes, to check that they switch from sequential scans to index scans.
+
+  python benchmarks/explain_show_indexes.py [--analyze]
+
+The indexes are not dropped: the "before" plans are produced by disabling index
+and bitmap scans for the transaction, which is what the planner would do without
+them. Run it against a database with a realistic amount of shows, on a handful of
+rows a sequential scan is the cheapest plan either way.
+"""
+import os
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from sqlalchemy import text
+
+from app import create_app
+from models import db
+
+
+QUERIES = {
+  'venue past/upcoming shows': '''
+    SELECT shows.dt, artists.id, artists.name, artists.image_link, shows.dt > :now AS upcoming
+    FROM shows JOIN artists ON artists.id = shows.artist_id
+    WHERE shows.venue_id = :venue_id
+    ORDER BY shows.dt, shows.id
+  ''',
+  'artist past/upcoming shows': '''
+    SELECT shows.dt, venues.id, venues.name, venues.image_link, shows.dt > :now AS upcoming
+    FROM shows JOIN venues ON venues.id = shows.venue_id
+    WHERE shows.artist_id = :artist_id
+    ORDER BY shows.dt, shows.id
+  ''',
+  'venue upcoming show count': '''
+    SELECT count(*) FROM shows WHERE shows.venue_id = :venue_id AND shows.dt > :now
+  ''',
+  'upcoming shows feed': '''
+    SELECT shows.id, shows.dt FROM shows
+    WHERE shows.dt > :now
+    ORDER BY shows.dt, shows.id
+    LIMIT 30
+  ''',
+}
+
+WITHOUT_INDEXES = (
+  'SET LOCAL enable_indexscan = off',
+  'SET LOCAL enable_bitmapscan = off',
+  'SET LOCAL enable_indexonlyscan = off',
+)
+
+
+def busiest(column):
+  # the venue/artist with the most shows, the case the indexes matter most for
+  return db.session.execute(text(
+    f'SELECT {column} FROM shows GROUP BY {column} ORDER BY count(*) DESC LIMIT 1'
+  )).scalar()
+
+
+def explain(sql, params, analyze, disable_indexes):
+  connection = db.engine.connect()
+  transaction = connection.begin()
+  try:
+    if disable_indexes:
+      for statement in WITHOUT_INDEXES:
+        connection.execute(text(statement))
+    prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    return [row[0] for row in connection.execute(text(prefix + sql), params)]
+  finally:
+    transaction.rollback()
+    connection.close()
+
+
+def main():
+  parser = ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--analyze', action='store_true', help='run EXPLAIN ANALYZE, executes the queries')
+  args = parser.parse_args()
+
+  with create_app().app_context():
+    print(f"shows: {db.session.execute(text('SELECT count(*) FROM shows')).scalar()} rows")
+    params = {
+      'now': datetime.now(),
+      'venue_id': busiest('venue_id'),
+      'artist_id': busiest('artist_id'),
+    }
+    for name, sql in QUERIES.items():
+      for label, disable_indexes in (('without indexes', True), ('with indexes', False)):
+        print(f'\n=== {name} ({label})')
+        for line in explain(sql, params, args.analyze, disable_indexes):
+          print(line)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,397 @@
+"""Benchmarks the routes and reports latency, queries per request and throughput.
+
+  python benchmarks/run.py                          # the database of the current profile
+  python benchmarks/run.py --sqlite --seed          # a throwaway SQLite stand-in
+  python benchmarks/run.py --compare benchmarks/results/<earlier run>.json
+  python benchmarks/run.py --sqlite --smoke         # every route once, fails on 5xx
+  python benchmarks/run.py --async --threads 16     # the async read path
+  python benchmarks/run.py --sqlite --writes        # the form submissions too
+
+Requests go through the Flask test client: the numbers cover the app and the
+database, not the network or the WSGI server. The response cache is off unless
+--cache is given, so each request does its full work. Statement counts and SQL
+time come from the metrics module's collectors (the Server-Timing header on the
+async path), so METRICS_ENABLED must be on.
+
+The SQLite stand-in swaps the postgres column types for JSON and drops the
+postgres-only indexes and constraints. It runs the routes that do not depend on
+postgres operators and is only meant for quick relative comparisons.
+Postgres numbers are the ones that matter.
+
+Only the read routes run by default. --writes adds the create, edit and delete
+submissions, after the reads. They insert, change and delete rows (the delete
+takes the least busy venues), so point them at a throwaway seeded database: the
+SQLite stand-in, or a postgres copy seeded with --seed. --smoke on a temporary
+SQLite file includes them. A submission answers 200 or a redirect whether it was
+saved or not, the row counts printed at the end show what was written.
+
+With --async the routes asgi.py serves are measured on the async app instead,
+through its test client with --threads concurrent tasks on one event loop, i.e.
+one async worker. Compare it with a sync run of the same --threads (and --route)
+for the throughput of a worker on either path. It needs postgres, quart and asyncpg.
+
+Every run is saved to benchmarks/results/ as JSON (unless --no-save), with the
+git revision and the row counts, so later runs can be compared with --compare.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from sqlalchemy import func
+
+import config
+from app import create_app
+from metrics import metrics
+from models import db, Venue, Artist, Show, use_sqlite
+from seed import seed
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SERVER_TIMING = re.compile(r'sql;dur=([\d.]+);desc="(\d+) queries"')
+# the routes asgi.py serves
+ASYNC_ROUTES = {
+  'venues', 'venues by genre', 'search venues', 'search venues, page 3', 'venue', 'artists',
+  'search artists', 'artist', 'shows', 'upcoming shows',
+}
+
+
+def routes(sample):
+  # (name, url, needs postgres) for every read route, on the busiest venue/artist
+  venue, artist, month = sample['venue_id'], sample['artist_id'], sample['month']
+  start = sample['start']
+  return [
+    ('home', '/', False),
+    ('venues', '/venues', False),
+    ('venues by genre', '/venues?genre=Jazz', True),
+    ('search venues', '/venues/search?search_term=music', False),
+    ('search venues, page 3', '/venues/search?search_term=a&page=3', False),
+    ('venue', f'/venues/{venue}', False),
+    ('venue calendar', f'/venues/{venue}/calendar?month={month}', False),
+    ('venue calendar ics', f'/venues/{venue}/calendar.ics?month={month}', False),
+    ('edit venue form', f'/venues/{venue}/edit', False),
+    ('new venue form', '/venues/create', False),
+    ('artists', '/artists', False),
+    ('search artists', '/artists/search?search_term=band', False),
+    ('artist', f'/artists/{artist}', False),
+    ('artist calendar', f'/artists/{artist}/calendar?month={month}', False),
+    ('edit artist form', f'/artists/{artist}/edit', False),
+    ('new artist form', '/artists/create', False),
+    ('shows', '/shows', False),
+    ('upcoming shows', '/shows?upcoming=1', False),
+    ('new show form', '/shows/create', False),
+    ('full text search', '/search?q=jazz', True),
+    ('api venues', '/api/v1/venues?fields=id,name,city,upcoming_show_count', False),
+    ('api venue', f'/api/v1/venues/{venue}', False),
+    ('api venue availability', f'/api/v1/venues/{venue}/availability?start={start}', True),
+    ('api artists', '/api/v1/artists?genre=Jazz', True),
+    ('api artist', f'/api/v1/artists/{artist}', False),
+    ('api shows', '/api/v1/shows?upcoming=1&limit=100', False),
+  ]
+
+
+def write_routes(sample):
+  # (name, method, url, form data, needs postgres) for the form submissions. url and
+  # data are functions of the request number, so each request writes a row of its own
+  venue, artist, spare = sample['venue_id'], sample['artist_id'], sample['spare_venue_ids']
+  # far enough ahead not to overlap the seeded bookings of the busiest venue and artist
+  first_show = datetime.fromisoformat(sample['start']) + timedelta(days=3650)
+  venue_form = lambda number: {
+    'name': f'Benchmark Venue {number}', 'city': 'SanFrancisco', 'state': 'CA', 'address': f'{number} Main St',
+    'phone': '4155550100', 'genres': ['Jazz', 'Rock'], 'facebook_link': '',
+  }
+  artist_form = lambda number: {
+    'name': f'Benchmark Artist {number}', 'city': 'SanFrancisco', 'state': 'CA', 'phone': '4155550100',
+    'genres': ['Jazz'], 'facebook_link': '',
+  }
+  show_form = lambda number: {
+    'artist_id': artist, 'venue_id': venue, 'start_time': f'{first_show + timedelta(days=number):%Y-%m-%d %H:%M:%S}',
+  }
+  return [
+    ('create venue', 'POST', lambda number: '/venues/create', venue_form, False),
+    ('edit venue', 'POST', lambda number: f'/venues/{venue}/edit', venue_form, False),
+    ('delete venue', 'DELETE', lambda number: f'/venues/{spare[number % len(spare)]}', None, False),
+    ('create artist', 'POST', lambda number: '/artists/create', artist_form, False),
+    ('edit artist', 'POST', lambda number: f'/artists/{artist}/edit', artist_form, False),
+    # the handler passes the submitted string on, SQLite only takes datetimes
+    ('create show', 'POST', lambda number: '/shows/create', show_form, True),
+  ]
+
+#----------------------------------------------------------------------------#
+# SQLite stand-in.
+#----------------------------------------------------------------------------#
+
+class SQLiteConfig(config.TestingConfig):
+  SQLALCHEMY_ENGINE_OPTIONS = {}
+  N_PLUS_ONE_THRESHOLD = 0
+  SLOW_QUERY_MS = 0
+
+#----------------------------------------------------------------------------#
+# Measurements.
+#----------------------------------------------------------------------------#
+
+def percentile(values, fraction):
+  # nearest rank
+  ordered = sorted(values)
+  return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def timing(response, elapsed):
+  match = SERVER_TIMING.search(response.headers.get('Server-Timing', ''))
+  sql_time, queries = (float(match.group(1)) / 1000, int(match.group(2))) if match else (None, None)
+  return response.status_code, elapsed, queries, sql_time
+
+
+def request(client, url, method='GET', data=None):
+  start = time.perf_counter()
+  response = client.open(url, method=method, data=data)
+  response.get_data()
+  elapsed = time.perf_counter() - start
+  if method != 'GET':
+    # every submission flashes a message, they would pile up in the session cookie
+    client.cookie_jar.clear()
+  return timing(response, elapsed)
+
+
+def summarize(url, samples, wall):
+  latencies = [elapsed for _, elapsed, _, _ in samples]
+  queries = [queries for _, _, queries, _ in samples if queries is not None]
+  sql_times = [sql_time for _, _, _, sql_time in samples if sql_time is not None]
+  return {
+    'url': url,
+    'requests': len(samples),
+    'errors': sum(1 for status, _, _, _ in samples if status >= 500),
+    'statuses': sorted({status for status, _, _, _ in samples}),
+    'p50_ms': percentile(latencies, 0.50) * 1000,
+    'p95_ms': percentile(latencies, 0.95) * 1000,
+    'p99_ms': percentile(latencies, 0.99) * 1000,
+    'queries_per_request': sum(queries) / len(queries) if queries else None,
+    'sql_mean_ms': sum(sql_times) / len(sql_times) * 1000 if sql_times else None,
+    'throughput_rps': len(samples) / wall if wall else None,
+  }
+
+
+def measure(app, method, url, data, count, warmup, threads):
+  # url and data are functions of the request number, warmup requests included
+  clients = [app.test_client() for _ in range(threads)]
+  send = lambda client, number: request(client, url(number), method, data(number) if data else None)
+  for number in range(warmup):
+    send(clients[0], number)
+  queries, sql_time = metrics.sql_queries.totals(), metrics.sql_time.totals()
+  started = time.perf_counter()
+  if threads == 1:
+    samples = [send(clients[0], warmup + number) for number in range(count)]
+  else:
+    with ThreadPoolExecutor(threads) as pool:
+      samples = list(pool.map(lambda number: send(clients[number % threads], warmup + number), range(count)))
+  result = summarize(url(0) if method == 'GET' else f'{method} {url(0)}', samples, time.perf_counter() - started)
+  # the Server-Timing header of a streamed page only covers its first byte, the
+  # collectors are updated once the body has been read
+  (requests, query_total), (_, sql_total) = metrics.sql_queries.totals(), metrics.sql_time.totals()
+  if requests > queries[0]:
+    result['queries_per_request'] = (query_total - queries[1]) / (requests - queries[0])
+    result['sql_mean_ms'] = (sql_total - sql_time[1]) / (requests - queries[0]) * 1000
+  return result
+
+
+async def request_async(client, url):
+  start = time.perf_counter()
+  response = await client.get(url)
+  await response.get_data()
+  return timing(response, time.perf_counter() - start)
+
+
+async def measure_async(app, url, count, warmup, tasks):
+  # `tasks` requests in flight at any time, all on this event loop
+  client = app.test_client()
+  for _ in range(warmup):
+    await request_async(client, url)
+  slots = asyncio.Semaphore(tasks)
+
+  async def limited():
+    async with slots:
+      return await request_async(client, url)
+
+  started = time.perf_counter()
+  samples = await asyncio.gather(*(limited() for _ in range(count)))
+  return summarize(url, samples, time.perf_counter() - started)
+
+
+async def run_async(app, selected, args):
+  # the pool is opened and closed by the app's serving hooks
+  await app.startup()
+  try:
+    return [dict(await measure_async(app, url, args.requests, args.warmup, args.threads), name=name)
+            for name, url in selected]
+  finally:
+    await app.shutdown()
+
+
+def sample_ids(spare=0):
+  # `spare` venues to delete, the least busy ones other than the sampled venue
+  busiest = lambda fk: db.session.query(fk).group_by(fk).order_by(func.count(Show.id).desc()).limit(1).scalar()
+  now = datetime.now()
+  venue = busiest(Show.venue_id) or 1
+  spare_venues = (db.session.query(Venue.id).filter(Venue.id != venue)
+                  .order_by(Venue.upcoming_show_count + Venue.past_show_count, Venue.id).limit(spare))
+  return {
+    'venue_id': venue,
+    'artist_id': busiest(Show.artist_id) or 1,
+    'spare_venue_ids': [id for id, in spare_venues] or [0],
+    'month': f'{now:%Y-%m}',
+    'start': (now + timedelta(days=7)).replace(hour=20, minute=0, second=0, microsecond=0).isoformat(),
+  }
+
+
+def row_counts():
+  return {model.__tablename__: db.session.query(func.count(model.id)).scalar() for model in (Venue, Artist, Show)}
+
+
+def git_revision():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(RESULTS_DIR),
+                                   stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+#----------------------------------------------------------------------------#
+# Reports.
+#----------------------------------------------------------------------------#
+
+def format_number(value, digits=1):
+  return '-' if value is None else f'{value:.{digits}f}'
+
+
+def print_report(results, baseline=None):
+  baseline = {result['name']: result for result in (baseline or {}).get('routes', [])}
+  header = f"{'route':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'sql ms':>7} {'req/s':>8} {'errors':>6}"
+  if baseline:
+    header += f" {'p95 vs base':>12}"
+  print(header)
+  for result in results:
+    line = (f"{result['name']:<26} {format_number(result['p50_ms']):>8} {format_number(result['p95_ms']):>8} "
+            f"{format_number(result['p99_ms']):>8} {format_number(result['queries_per_request']):>8} "
+            f"{format_number(result.get('sql_mean_ms')):>7} {format_number(result['throughput_rps'], 0):>8} {result['errors']:>6}")
+    before = baseline.get(result['name'])
+    if before and before['p95_ms']:
+      line += f" {(result['p95_ms'] / before['p95_ms'] - 1) * 100:>+11.0f}%"
+    print(line)
+
+
+def main():
+  parser = ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--sqlite', nargs='?', const='', default=None, metavar='PATH',
+                      help='run against a SQLite stand-in (a temporary file unless PATH is given)')
+  parser.add_argument('--seed', action='store_true', help='seed the database first, see seed.py')
+  parser.add_argument('--venues', type=int, default=200)
+  parser.add_argument('--artists', type=int, default=500)
+  parser.add_argument('--shows', type=int, default=5000)
+  parser.add_argument('--requests', type=int, default=50, help='requests per route')
+  parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per route')
+  parser.add_argument('--threads', type=int, default=1, help='concurrent clients (tasks with --async)')
+  parser.add_argument('--async', dest='async_path', action='store_true', help='measure the async app of asgi.py')
+  parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+  parser.add_argument('--writes', action='store_true',
+                      help='also run the create/edit/delete submissions, they change the database')
+  parser.add_argument('--route', action='append', default=[], help='only run routes whose name contains this')
+  parser.add_argument('--compare', metavar='FILE', help='a saved run to compare with')
+  parser.add_argument('--no-save', action='store_true', help='do not store the results')
+  parser.add_argument('--smoke', action='store_true', help='one request per route, exit 1 on any 5xx')
+  args = parser.parse_args()
+  if args.smoke:
+    args.requests, args.warmup, args.no_save = 1, 0, True
+
+  if args.sqlite is not None:
+    path = args.sqlite or os.path.join(tempfile.mkdtemp(), 'fyyur-benchmark.db')
+    SQLiteConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    use_sqlite(db.metadata)
+    # a new temporary file is always empty, and thrown away
+    args.seed = args.seed or args.smoke or not args.sqlite
+    args.writes = args.writes or (args.smoke and not args.sqlite)
+
+  class BenchmarkConfig(SQLiteConfig if args.sqlite is not None else config.get_config()):
+    CACHE_TYPE = 'simple' if args.cache else 'null'
+    METRICS_ENABLED = True
+
+  app = create_app(BenchmarkConfig)
+  with app.app_context():
+    backend = db.engine.url.get_backend_name()
+    if args.sqlite is not None:
+      db.create_all()
+    if args.seed:
+      seed(args.venues, args.artists, args.shows, random.Random(42), app.config['IMPORT_BATCH_SIZE'])
+    counts = row_counts()
+    sample = sample_ids(args.warmup + args.requests if args.writes else 0)
+    db.session.remove()
+
+  if args.async_path and backend != 'postgresql':
+    parser.error('--async needs postgres')
+  print(f"{backend}: {counts['venues']} venues, {counts['artists']} artists, {counts['shows']} shows, "
+        f"{args.requests} requests per route, {args.threads} {'task' if args.async_path else 'thread'}(s)")
+  # (name, method, url, data, needs postgres), the writes after the reads
+  candidates = [(name, 'GET', lambda number, url=url: url, None, needs_postgres) for name, url, needs_postgres in routes(sample)]
+  if args.writes:
+    candidates += write_routes(sample)
+  selected = []
+  for name, method, url, data, needs_postgres in candidates:
+    if args.route and not any(part in name for part in args.route):
+      continue
+    if needs_postgres and backend != 'postgresql':
+      continue
+    if args.async_path and name not in ASYNC_ROUTES:
+      continue
+    selected.append((name, method, url, data))
+
+  if args.async_path:
+    # quart and asyncpg are only needed here
+    from asgi import create_async_app
+    reads = [(name, url(0)) for name, _, url, _ in selected]
+    results = asyncio.run(run_async(create_async_app(BenchmarkConfig), reads, args))
+  else:
+    results = [dict(measure(app, method, url, data, args.requests, args.warmup, args.threads), name=name)
+               for name, method, url, data in selected]
+
+  baseline = None
+  if args.compare:
+    with open(args.compare) as file:
+      baseline = json.load(file)
+  print_report(results, baseline)
+  if args.writes:
+    with app.app_context():
+      written = row_counts()
+      db.session.remove()
+    print('\nrows after the writes: ' + ', '.join(f'{written[table]} {table} ({written[table] - counts[table]:+d})'
+                                                  for table in counts))
+
+  if not args.no_save:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    run = {
+      'date': datetime.now().isoformat(timespec='seconds'),
+      'revision': git_revision(),
+      'backend': backend,
+      'rows': counts,
+      'options': {'requests': args.requests, 'threads': args.threads, 'cache': args.cache, 'async': args.async_path,
+                  'writes': args.writes},
+      'routes': results,
+    }
+    path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{backend}{'-async' if args.async_path else ''}.json")
+    with open(path, 'w') as file:
+      json.dump(run, file, indent=2)
+    print(f'\nsaved to {path}')
+
+  if any(result['errors'] for result in results):
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,153 @@
+"""Seeds the database with synthetic venues, artists and shows.
+
+  python benchmarks/seed.py --venues 2000 --artists 5000 --shows 200000 [--seed 42]
+
+Popularity is skewed like real listings: venues and artists are drawn with Zipf
+weights, so a few of them host most of the shows and the long tail has one or
+none, and cities follow the same kind of curve. Shows are spread from a year ago
+to a year ahead, on a grid of start times that never double books a venue or an
+artist (the shows exclusion constraints would reject the batch otherwise).
+Rows are inserted in IMPORT_BATCH_SIZE batches and the show counters refreshed
+at the end. Run it against an empty, migrated database (`flask db upgrade`).
+"""
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from app import create_app
+from forms import VenueForm
+from models import db, Venue, Artist, Show, refresh_show_counts
+
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+CITIES = [
+  ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('San Francisco', 'CA'), ('Austin', 'TX'),
+  ('Nashville', 'TN'), ('Seattle', 'WA'), ('New Orleans', 'LA'), ('Boston', 'MA'), ('Denver', 'CO'),
+  ('Atlanta', 'GA'), ('Portland', 'OR'), ('Detroit', 'MI'), ('Memphis', 'TN'), ('Miami', 'FL'),
+  ('Philadelphia', 'PA'), ('Minneapolis', 'MN'), ('Phoenix', 'AZ'), ('Baltimore', 'MD'), ('Omaha', 'NE'),
+]
+WORDS = [
+  'Musical', 'Hop', 'Park', 'Square', 'Live', 'Music', 'Coffee', 'Dueling', 'Pianos', 'Bar', 'Wild', 'Sax',
+  'Band', 'Guns', 'Petals', 'Blue', 'Note', 'Velvet', 'Room', 'Electric', 'Lounge', 'Hall', 'Garden', 'Cellar',
+  'Echo', 'Rooftop', 'Harbor', 'Union', 'Neon', 'Owl', 'Fox', 'Quartet', 'Collective', 'Trio', 'Brass', 'Soul',
+]
+# shows start at one of these hours and last at most DURATIONS[-1] minutes, so two
+# shows in different slots never overlap
+SLOT_HOURS = (12, 16, 20)
+DURATIONS = (60, 90, 120, 180)
+DAYS = 365
+
+
+def zipf_weights(count, exponent=1.1):
+  return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def name(rng, words=2):
+  return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def contact(rng, city_weights):
+  city, state = rng.choices(CITIES, cum_weights=city_weights)[0]
+  return {
+    'city': city,
+    'state': state,
+    'phone': ''.join(rng.choice('0123456789') for _ in range(10)),
+    'genres': rng.sample(GENRES, rng.randint(1, 3)),
+    'image_link': f'https://picsum.photos/seed/{rng.randrange(10 ** 6)}/300/300',
+    'facebook_link': None,
+    'website': None,
+    'seeking': rng.random() < 0.3,
+    'seeking_desc': None,
+  }
+
+
+def venue_records(rng, count, city_weights):
+  for number in range(count):
+    yield dict(contact(rng, city_weights), name=f'{name(rng)} {number}', address=f'{rng.randint(1, 9999)} {name(rng, 1)} St')
+
+
+def artist_records(rng, count, city_weights):
+  for number in range(count):
+    yield dict(contact(rng, city_weights), name=f'{name(rng, rng.randint(1, 3))} {number}')
+
+
+def show_records(rng, count, venue_ids, artist_ids, now):
+  # a slot is a day and one of SLOT_HOURS
+  slots = (2 * DAYS + 1) * len(SLOT_HOURS)
+  if count > slots * min(len(venue_ids), len(artist_ids)):
+    raise ValueError('not enough venues/artists to place that many shows without double bookings')
+  venue_weights = zipf_weights(len(venue_ids))
+  artist_weights = zipf_weights(len(artist_ids))
+  first_day = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=DAYS)
+  # (venue, slot) and (artist, slot) pairs already booked
+  venues_taken, artists_taken = set(), set()
+  placed = 0
+  while placed < count:
+    venue_id = rng.choices(venue_ids, cum_weights=venue_weights)[0]
+    artist_id = rng.choices(artist_ids, cum_weights=artist_weights)[0]
+    slot = rng.randrange(slots)
+    if (venue_id, slot) in venues_taken or (artist_id, slot) in artists_taken:
+      continue
+    venues_taken.add((venue_id, slot))
+    artists_taken.add((artist_id, slot))
+    day, hour = divmod(slot, len(SLOT_HOURS))
+    placed += 1
+    yield {
+      'venue_id': venue_id,
+      'artist_id': artist_id,
+      'dt': first_day + timedelta(days=day, hours=SLOT_HOURS[hour]),
+      'duration': rng.choice(DURATIONS),
+    }
+
+
+def insert(model, records, batch_size):
+  batch = []
+  for record in records:
+    batch.append(record)
+    if len(batch) == batch_size:
+      db.session.execute(model.__table__.insert(), batch)
+      batch = []
+  if batch:
+    db.session.execute(model.__table__.insert(), batch)
+  db.session.commit()
+
+
+def seed(venues, artists, shows, rng=None, batch_size=1000):
+  # meant for an empty database, existing shows are not taken into account when
+  # placing the new ones
+  rng = rng or random.Random()
+  city_weights = zipf_weights(len(CITIES), 0.8)
+  insert(Venue, venue_records(rng, venues, city_weights), batch_size)
+  insert(Artist, artist_records(rng, artists, city_weights), batch_size)
+  venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+  artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id)]
+  # shuffled, so the most popular ones are not simply the oldest rows
+  rng.shuffle(venue_ids)
+  rng.shuffle(artist_ids)
+  insert(Show, show_records(rng, shows, venue_ids, artist_ids, datetime.now()), batch_size)
+  refresh_show_counts(Venue)
+  refresh_show_counts(Artist)
+  db.session.commit()
+
+
+def main():
+  parser = ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--venues', type=int, default=200)
+  parser.add_argument('--artists', type=int, default=500)
+  parser.add_argument('--shows', type=int, default=5000)
+  parser.add_argument('--seed', type=int, default=None, help='random seed, for a reproducible data set')
+  args = parser.parse_args()
+
+  app = create_app()
+  with app.app_context():
+    seed(args.venues, args.artists, args.shows, random.Random(args.seed), app.config['IMPORT_BATCH_SIZE'])
+    print(f'seeded {args.venues} venues, {args.artists} artists and {args.shows} shows')
+
+
+if __name__ == '__main__':
+  main()
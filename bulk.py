@@ -0,0 +1,341 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from werkzeug.datastructures import MultiDict
+
+from api import VENUE_FIELDS, ARTIST_FIELDS, ApiError, api_error, json_response, serialize, token_required
+from cache import cache
+from forms import VenueForm, ArtistForm, ShowForm, valid_contact, clean_facebook_link
+from models import db, Venue, Artist, Show, refresh_show_counts
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#
+# Rows are streamed from CSV or JSONL, validated with the same forms and checks
+# as the create handlers, and inserted in batches of IMPORT_BATCH_SIZE with one
+# executemany per batch (execute_values on psycopg2, see config.py).
+# A batch the database rejects is rolled back and reported, the other
+# batches are kept.
+#----------------------------------------------------------------------------#
+
+bulk = Blueprint('bulk', __name__, url_prefix='/api/v1', cli_group=None)
+bulk.register_error_handler(ApiError, api_error)
+
+FORMATS = ('csv', 'jsonl')
+
+
+def read_rows(stream, format):
+  # yields (line number, row dict) from a text stream, without reading it all in
+  if format == 'csv':
+    reader = csv.DictReader(stream)
+    for row in reader:
+      yield reader.line_num, row
+  elif format == 'jsonl':
+    for line_number, line in enumerate(stream, 1):
+      if line.strip():
+        try:
+          yield line_number, json.loads(line)
+        except ValueError as error:
+          yield line_number, error
+  else:
+    raise ValueError(f'Unknown format {format!r}')
+
+
+def as_list(value):
+  # genres come as a JSON list, or as a comma separated CSV cell
+  if value is None:
+    return []
+  if isinstance(value, str):
+    return [item.strip() for item in value.split(',') if item.strip()]
+  return list(value)
+
+
+def as_bool(value, default=True):
+  if value in (None, ''):
+    return default
+  if isinstance(value, str):
+    return value.strip().lower() in ('1', 'true', 'yes', 'y')
+  return bool(value)
+
+
+def form_errors(form, row):
+  form.process(formdata=MultiDict(
+    [(key, str(value)) for key, value in row.items() if key != 'genres' and value is not None] +
+    [('genres', genre) for genre in as_list(row.get('genres'))]
+  ))
+  form.validate()
+  errors = dict(form.errors)
+  # a blank facebook link is accepted and dropped, like the create handlers do
+  if not row.get('facebook_link'):
+    errors.pop('facebook_link', None)
+  return errors
+
+
+def text_fields(row, names):
+  return {name: str(row[name]).strip() if row.get(name) is not None else '' for name in names}
+
+
+def venue_record(form, row):
+  errors = form_errors(form, row)
+  data = text_fields(row, ('name', 'city', 'state', 'address', 'phone'))
+  if not errors and not valid_contact(data):
+    errors['contact'] = ['city and state must be alphabetic, phone must be numeric']
+  if errors:
+    return None, errors
+  return dict(
+    data,
+    genres=as_list(row.get('genres')),
+    image_link=row.get('image_link') or None,
+    facebook_link=clean_facebook_link(row.get('facebook_link')),
+    website=row.get('website') or None,
+    seeking=as_bool(row.get('seeking_talent')),
+    seeking_desc=row.get('seeking_description') or None
+  ), None
+
+
+def artist_record(form, row):
+  errors = form_errors(form, row)
+  data = text_fields(row, ('name', 'city', 'state', 'phone'))
+  if not errors and not valid_contact(data):
+    errors['contact'] = ['city and state must be alphabetic, phone must be numeric']
+  if errors:
+    return None, errors
+  return dict(
+    data,
+    genres=as_list(row.get('genres')),
+    image_link=row.get('image_link') or None,
+    facebook_link=clean_facebook_link(row.get('facebook_link')),
+    website=row.get('website') or None,
+    seeking=as_bool(row.get('seeking_venue')),
+    seeking_desc=row.get('seeking_description') or None
+  ), None
+
+
+def show_record(form, row):
+  errors = form_errors(form, row)
+  if not row.get('start_time'):
+    # without a value the form would fall back to its default start time
+    errors['start_time'] = ['This field is required.']
+  record = {}
+  for field in ('artist_id', 'venue_id'):
+    try:
+      record[field] = int(row.get(field))
+    except (TypeError, ValueError):
+      errors[field] = ['must be an integer id']
+  if errors:
+    return None, errors
+  record['dt'] = form.start_time.data
+  record['duration'] = form.duration.data
+  return record, None
+
+
+KINDS = {
+  'venues': (Venue, VenueForm, venue_record),
+  'artists': (Artist, ArtistForm, artist_record),
+  'shows': (Show, ShowForm, show_record),
+}
+
+
+def missing_references(records):
+  # the venue/artist ids of a batch of shows that do not exist, two queries per batch
+  missing = {}
+  for model, field in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    ids = {record[field] for record in records}
+    found = {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+    missing[field] = ids - found
+  return missing
+
+
+def import_rows(kind, rows, batch_size=None):
+  # rows is an iterable of (line number, row) as produced by read_rows().
+  # returns {'inserted': n, 'errors': [{'line': n, 'errors': {...}}, ...]}
+  model, form_class, to_record = KINDS[kind]
+  batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+  form = form_class(formdata=None, meta={'csrf': False})
+  report = {'inserted': 0, 'errors': []}
+
+  rows = iter(rows)
+  while True:
+    chunk = list(islice(rows, batch_size))
+    if not chunk:
+      break
+    lines, records = [], []
+    for line, row in chunk:
+      if not isinstance(row, dict):
+        report['errors'].append({'line': line, 'errors': {'row': [str(row) or 'not an object']}})
+        continue
+      record, errors = to_record(form, row)
+      if errors:
+        report['errors'].append({'line': line, 'errors': errors})
+      else:
+        lines.append(line)
+        records.append(record)
+
+    if kind == 'shows' and records:
+      missing = missing_references(records)
+      kept = []
+      for line, record in zip(lines, records):
+        errors = {field: ['does not exist'] for field in missing if record[field] in missing[field]}
+        if errors:
+          report['errors'].append({'line': line, 'errors': errors})
+        else:
+          kept.append((line, record))
+      lines, records = [line for line, _ in kept], [record for _, record in kept]
+
+    if not records:
+      continue
+    try:
+      db.session.execute(model.__table__.insert(), records)
+      if kind == 'shows':
+        refresh_show_counts(Venue, Venue.id.in_({record['venue_id'] for record in records}))
+        refresh_show_counts(Artist, Artist.id.in_({record['artist_id'] for record in records}))
+      db.session.commit()
+      report['inserted'] += len(records)
+    except Exception as error:
+      db.session.rollback()
+      message = str(getattr(error, 'orig', error)).strip()
+      report['errors'].extend({'line': line, 'errors': {'batch': [message]}} for line in lines)
+
+  if report['inserted']:
+    # new shows change the venue and artist counters too
+    namespaces = ('shows', 'venues', 'artists') if kind == 'shows' else (kind,)
+    cache.invalidate(*namespaces)
+  report['errors'].sort(key=lambda error: error['line'])
+  return report
+
+#----------------------------------------------------------------------------#
+# Export.
+#
+# Rows are read through a server-side cursor (yield_per) in id order and
+# written out chunk by chunk, so memory use does not depend on the table size.
+# An interrupted dump is resumed with start_id = last exported id + 1.
+#----------------------------------------------------------------------------#
+
+EXPORT_FIELDS = {
+  'venues': (Venue, VENUE_FIELDS),
+  'artists': (Artist, ARTIST_FIELDS),
+  'shows': (Show, {
+    'id': Show.id,
+    'artist_id': Show.artist_id,
+    'venue_id': Show.venue_id,
+    'start_time': Show.dt,
+    'duration': Show.duration,
+    'updated_at': Show.updated_at,
+  }),
+}
+
+
+def export_value(value):
+  # CSV cells, lists are written the way the importer reads them back
+  if value is None:
+    return ''
+  if isinstance(value, (list, tuple)):
+    return ','.join(value)
+  if isinstance(value, datetime):
+    return value.isoformat(' ')
+  return value
+
+
+def export_json(value):
+  # JSONL values, datetimes the way the importer reads them back (the API's
+  # serialize() writes ISO 8601, with a 'T' the forms do not accept)
+  if isinstance(value, datetime):
+    return value.isoformat(' ')
+  return serialize(value)
+
+
+def export_rows(kind, format, start_id=None, end_id=None, chunk_size=None):
+  # yields the dump as text chunks of about chunk_size rows each
+  model, fields = EXPORT_FIELDS[kind]
+  chunk_size = chunk_size or current_app.config['EXPORT_CHUNK_SIZE']
+  names = list(fields)
+  query = db.session.query(*fields.values())
+  if start_id is not None:
+    query = query.filter(model.id >= start_id)
+  if end_id is not None:
+    query = query.filter(model.id <= end_id)
+  rows = query.order_by(model.id).yield_per(chunk_size)
+
+  buffer = io.StringIO()
+  writer = csv.writer(buffer) if format == 'csv' else None
+  if writer:
+    writer.writerow(names)
+  count = 0
+  for row in rows:
+    if writer:
+      writer.writerow([export_value(value) for value in row])
+    else:
+      buffer.write(json.dumps(dict(zip(names, row)), default=export_json, separators=(',', ':')))
+      buffer.write('\n')
+    count += 1
+    if count % chunk_size == 0:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  yield buffer.getvalue()
+
+#----------------------------------------------------------------------------#
+# HTTP endpoints and CLI commands.
+#----------------------------------------------------------------------------#
+
+@bulk.route('/import/<kind>', methods=['POST'])
+@token_required
+def import_endpoint(kind):
+  # the body is the file itself, ?format=csv|jsonl (default: from the Content-Type)
+  if kind not in KINDS:
+    raise ApiError(404, f'Unknown kind {kind!r}')
+  format = request.args.get('format') or ('jsonl' if 'json' in (request.mimetype or '') else 'csv')
+  if format not in FORMATS:
+    raise ApiError(400, f'Unknown format {format!r}')
+  stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+  report = import_rows(kind, read_rows(stream, format))
+  return json_response(report, 200 if not report['errors'] else 207)
+
+
+@bulk.cli.command('import-data')
+@click.argument('kind', type=click.Choice(list(KINDS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(FORMATS), default=None,
+              help='Input format, guessed from the file extension by default.')
+@click.option('--batch-size', type=int, default=None, help='Rows per INSERT batch.')
+def import_command(kind, file, format, batch_size):
+  """Bulk import venues, artists or shows from a CSV or JSONL file ('-' for stdin)."""
+  if format is None:
+    format = 'jsonl' if file.name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+  report = import_rows(kind, read_rows(file, format), batch_size)
+  for error in report['errors']:
+    click.echo(f"line {error['line']}: {json.dumps(error['errors'])}", err=True)
+  click.echo(f"{report['inserted']} {kind} imported, {len(report['errors'])} rows rejected")
+
+
+@bulk.route('/export/<kind>')
+@token_required
+def export_endpoint(kind):
+  # ?format=csv|jsonl, ?start_id= and ?end_id= (inclusive) select an id range
+  if kind not in EXPORT_FIELDS:
+    raise ApiError(404, f'Unknown kind {kind!r}')
+  format = request.args.get('format', 'csv')
+  if format not in FORMATS:
+    raise ApiError(400, f'Unknown format {format!r}')
+  chunks = export_rows(kind, format, request.args.get('start_id', type=int), request.args.get('end_id', type=int))
+  mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+  return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+    'Content-Disposition': f'attachment; filename={kind}.{format}'
+  })
+
+
+@bulk.cli.command('export')
+@click.argument('kind', type=click.Choice(list(EXPORT_FIELDS)))
+@click.option('--format', 'format', type=click.Choice(FORMATS), default='csv', help='Output format.')
+@click.option('--start-id', type=int, default=None, help='First id to export, to resume a dump.')
+@click.option('--end-id', type=int, default=None, help='Last id to export.')
+@click.option('-o', '--output', type=click.File('w', encoding='utf-8'), default='-', help='Output file, stdout by default.')
+def export_command(kind, format, start_id, end_id, output):
+  """Dump venues, artists or shows as CSV or JSONL."""
+  for chunk in export_rows(kind, format, start_id, end_id):
+    output.write(chunk)
@@ -0,0 +1,388 @@
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request, session, make_response, Response
+from jinja2 import nodes, Undefined
+from jinja2.ext import Extension
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class NullCache(object):
+  # caches nothing, used when CACHE_TYPE is 'null' (e.g. while debugging templates)
+
+  def get(self, key):
+    return None
+
+  def set(self, key, value, timeout=None):
+    pass
+
+  def incr(self, key):
+    return 0
+
+  def counter(self, key):
+    return 0
+
+  def delete(self, key):
+    pass
+
+  def clear(self):
+    pass
+
+
+class LRUCache(object):
+  # in-process cache, entries expire after their timeout and the least recently
+  # used ones are evicted once there are more than max_entries of them, or they take
+  # more than max_size bytes (a streamed page can be a megabyte, the keys are the
+  # request URLs, query string included). every worker has its own copy,
+  # so invalidate() only reaches the worker that handled the write (use 'redis' with
+  # several workers).
+  #
+  # the namespace versions and invalidation times are kept apart from the entries
+  # and never evicted: a version that fell out would restart at 0 and bring the pages
+  # stored under the old numbers back
+  PINNED = ('version:', 'invalidated:')
+
+  def __init__(self, max_entries=1024, default_timeout=300, max_size=64 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.default_timeout = default_timeout
+    self.max_size = max_size
+    self.size = 0
+    self._entries = OrderedDict()
+    self._pinned = {}
+    self._lock = threading.Lock()
+
+  def _store(self, key):
+    return self._pinned if key.startswith(self.PINNED) else self._entries
+
+  def _remove(self, store, key):
+    expires, value, size = store.pop(key)
+    self.size -= size
+
+  def get(self, key):
+    store = self._store(key)
+    with self._lock:
+      entry = store.get(key)
+      if entry is None:
+        return None
+      expires, value, size = entry
+      if expires is not None and expires <= time.monotonic():
+        self._remove(store, key)
+        return None
+      if store is self._entries:
+        self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, timeout=None):
+    timeout = self.default_timeout if timeout is None else timeout
+    expires = time.monotonic() + timeout if timeout else None
+    store = self._store(key)
+    size = value_size(value) if store is self._entries else 0
+    with self._lock:
+      if key in store:
+        self._remove(store, key)
+      if size > self.max_size:
+        return
+      store[key] = (expires, value, size)
+      self.size += size
+      while len(self._entries) > self.max_entries or self.size > self.max_size:
+        self._remove(self._entries, next(iter(self._entries)))
+
+  def incr(self, key):
+    store = self._store(key)
+    with self._lock:
+      expires, value, size = store.get(key, (None, 0, 0))
+      store[key] = (None, value + 1, size)
+      return value + 1
+
+  def counter(self, key):
+    with self._lock:
+      return self._store(key).get(key, (None, 0, 0))[1]
+
+  def delete(self, key):
+    with self._lock:
+      store = self._store(key)
+      if key in store:
+        self._remove(store, key)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._pinned.clear()
+      self.size = 0
+
+
+def value_size(value):
+  # roughly the bytes a cached value holds: the page bodies and fragments, the
+  # headers next to them
+  if isinstance(value, (bytes, str)):
+    return len(value)
+  if isinstance(value, (list, tuple)):
+    return sum(value_size(item) for item in value)
+  return sys.getsizeof(value)
+
+
+class RedisCache(object):
+  # shared between workers. `client` is anything with the redis-py get/set/incr/delete
+  # interface, so a local stand-in (e.g. fakeredis) can replace a real server
+
+  def __init__(self, client, default_timeout=300, key_prefix='fyyur:'):
+    self.client = client
+    self.default_timeout = default_timeout
+    self.key_prefix = key_prefix
+
+  def get(self, key):
+    value = self.client.get(self.key_prefix + key)
+    return None if value is None else pickle.loads(value)
+
+  def set(self, key, value, timeout=None):
+    timeout = self.default_timeout if timeout is None else timeout
+    self.client.set(self.key_prefix + key, pickle.dumps(value), ex=timeout or None)
+
+  def incr(self, key):
+    return self.client.incr(self.key_prefix + key)
+
+  def counter(self, key):
+    # counters are stored by INCR as plain integers, not pickled
+    return int(self.client.get(self.key_prefix + key) or 0)
+
+  def delete(self, key):
+    self.client.delete(self.key_prefix + key)
+
+  def clear(self):
+    keys = list(self.client.scan_iter(match=self.key_prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+
+def create_backend(cache_type, config):
+  # CACHE_TYPE (or FRAGMENT_CACHE_TYPE) to a backend, the other settings are shared
+  if cache_type == 'null':
+    return NullCache()
+  if cache_type == 'simple':
+    return LRUCache(config['CACHE_MAX_ENTRIES'], config['CACHE_DEFAULT_TIMEOUT'], config['CACHE_MAX_SIZE'])
+  if cache_type == 'redis':
+    client = config['CACHE_REDIS_CLIENT']
+    if client is None:
+      import redis
+      client = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+    return RedisCache(client, config['CACHE_DEFAULT_TIMEOUT'], config['CACHE_KEY_PREFIX'])
+  raise ValueError(f'Unknown CACHE_TYPE {cache_type!r}')
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+def conditional(fingerprint):
+  # answers If-None-Match/If-Modified-Since with a 304 before the view runs.
+  # `fingerprint` is called with the view arguments and returns (etag, last_modified),
+  # or None when the view should just run (e.g. an unknown id)
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      validators = fingerprint(**kwargs)
+      if validators is None:
+        return view(*args, **kwargs)
+
+      etag, last_modified = validators
+      if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(view(*args, **kwargs))
+      else:
+        response = Response(status=304)
+      response.set_etag(etag, weak=True)
+      response.last_modified = last_modified
+      return response
+    return wrapper
+  return decorator
+
+#----------------------------------------------------------------------------#
+# Template fragments.
+#----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+  # {% cache key, ttl %}...{% endcache %} renders its body once per key and serves it
+  # from environment.fragment_cache (any backend above) afterwards. the key is a
+  # value or a list of values, put the updated_at of every row the fragment shows in
+  # it so that a change renders a new fragment. ttl is in seconds, the backend's
+  # default timeout without it. a key with an undefined part is never cached
+  #
+  #   {% cache ['show-tile', show.id, show.updated_at], 3600 %}...{% endcache %}
+
+  tags = {'cache'}
+
+  def __init__(self, environment):
+    super().__init__(environment)
+    environment.extend(fragment_cache=NullCache())
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    args = [parser.parse_expression()]
+    if parser.stream.skip_if('comma'):
+      args.append(parser.parse_expression())
+    else:
+      args.append(nodes.Const(None))
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    # in an async environment (the Quart app) caller() returns a coroutine
+    render = '_render_async' if self.environment.is_async else '_render'
+    return nodes.CallBlock(self.call_method(render, args), [], [], body).set_lineno(lineno)
+
+  def _key(self, key):
+    # None when a part of the key is undefined
+    parts = key if isinstance(key, (list, tuple)) else [key]
+    if any(isinstance(part, Undefined) for part in parts):
+      return None
+    return 'fragment:' + ':'.join(str(part) for part in parts)
+
+  def _render(self, key, ttl, caller):
+    key = self._key(key)
+    if key is None:
+      return caller()
+    store = self.environment.fragment_cache
+    html = store.get(key)
+    if html is None:
+      html = str(caller())
+      store.set(key, html, ttl)
+    return Markup(html)
+
+  async def _render_async(self, key, ttl, caller):
+    key = self._key(key)
+    if key is None:
+      return await caller()
+    store = self.environment.fragment_cache
+    html = store.get(key)
+    if html is None:
+      html = str(await caller())
+      store.set(key, html, ttl)
+    return Markup(html)
+
+
+def init_fragment_cache(app):
+  # the {% cache %} tag, with its own backend: a fragment is far cheaper to render than
+  # a page, a shared backend only pays off when it is much closer than the database
+  app.config.setdefault('FRAGMENT_CACHE_TYPE', 'simple')
+  app.jinja_env.add_extension(FragmentCacheExtension)
+  app.jinja_env.fragment_cache = create_backend(app.config['FRAGMENT_CACHE_TYPE'], app.config)
+
+#----------------------------------------------------------------------------#
+# Extension.
+#----------------------------------------------------------------------------#
+
+class Cache(object):
+  # response cache for the read views.
+  #
+  # every cached view declares the namespaces ('venues', 'artists', 'shows') of the data
+  # it renders. the write handlers call invalidate() with the namespaces they touched,
+  # which bumps a version number that is part of the cache keys, so stale pages are
+  # simply never looked up again and age out of the backend
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('CACHE_TYPE', 'simple')
+    app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+    app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+    app.config.setdefault('CACHE_MAX_SIZE', 64 * 1024 * 1024)
+    app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config.setdefault('CACHE_REDIS_CLIENT', None)
+    app.config.setdefault('CACHE_KEY_PREFIX', 'fyyur:')
+    app.config.setdefault('CACHE_MAX_STREAMED_SIZE', 1024 * 1024)
+    app.extensions['cache'] = create_backend(app.config['CACHE_TYPE'], app.config)
+    init_fragment_cache(app)
+
+  @property
+  def backend(self):
+    return current_app.extensions['cache']
+
+  def invalidate(self, *namespaces):
+    for namespace in namespaces:
+      self.backend.incr(f'version:{namespace}')
+      self.backend.set(f'invalidated:{namespace}', time.time())
+
+  def _replica_lag_check(self, namespaces):
+    # a page read from a replica right after a write may not show that write yet, it
+    # must not be stored under the new version. replicas are trusted to catch up
+    # within REPLICA_STICKY_SECONDS, see replicas.py. returns the check as a function:
+    # a streamed page only reads from the database while it is sent, so only then is
+    # it known whether a replica served it, after the request context is gone
+    backend = self.backend
+    state = g._get_current_object()
+    window = current_app.config.get('REPLICA_STICKY_SECONDS', 0)
+
+    def may_lag():
+      if not state.get('read_replica'):
+        return False
+      now = time.time()
+      return any(now - (backend.get(f'invalidated:{namespace}') or 0) < window for namespace in namespaces)
+    return may_lag
+
+  def _key(self, namespaces):
+    versions = '.'.join(str(self.backend.counter(f'version:{namespace}')) for namespace in namespaces)
+    return f'view:{versions}:{request.full_path}'
+
+  def _store_when_sent(self, key, response, timeout, may_lag):
+    # passes a streamed body through and stores it once it has been sent in full.
+    # bodies over CACHE_MAX_STREAMED_SIZE bytes are dropped on the way, so caching
+    # does not undo the bounded memory use of streaming. the body is sent after the
+    # request context is gone, everything needed is taken from it here
+    backend = self.backend
+    limit = current_app.config['CACHE_MAX_STREAMED_SIZE']
+    status, headers = response.status_code, list(response.headers)
+    body = response.response
+
+    def send():
+      chunks, size = [], 0
+      try:
+        for chunk in body:
+          yield chunk
+          if chunks is not None:
+            chunk = chunk.encode(response.charset) if isinstance(chunk, str) else chunk
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > limit:
+              chunks = None
+      finally:
+        # an interrupted download is not stored, and the view's generator is
+        # closed so that its request context is torn down
+        if hasattr(body, 'close'):
+          body.close()
+      if chunks is not None and not may_lag():
+        backend.set(key, (b''.join(chunks), status, headers), timeout)
+
+    return send()
+
+  def cached(self, *namespaces, timeout=None):
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        # pending flash messages are rendered into the page, such a page must
+        # neither be served from nor stored in the cache
+        if request.method != 'GET' or session.get('_flashes'):
+          return view(*args, **kwargs)
+
+        key = self._key(namespaces)
+        hit = self.backend.get(key)
+        if hit is not None:
+          body, status, headers = hit
+          return Response(body, status, headers).make_conditional(request)
+
+        response = make_response(view(*args, **kwargs))
+        may_lag = self._replica_lag_check(namespaces)
+        if response.status_code == 200 and not may_lag():
+          if response.is_streamed:
+            response.response = self._store_when_sent(key, response, timeout, may_lag)
+          else:
+            self.backend.set(key, (response.get_data(), response.status_code, list(response.headers)), timeout)
+        return response
+      return wrapper
+    return decorator
+
+cache = Cache()
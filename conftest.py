@@ -0,0 +1,4 @@
+# the fixtures of testing.py for everything under tests/
+pytest_plugins = ['testing']
+
+collect_ignore = ['node_modules']
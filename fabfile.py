@@ -6,8 +6,9 @@ from fabric.contrib.console import confirm
 
 def test():
     with settings(warn_only=True):
+        # every route once against a throwaway SQLite stand-in, fails on any 5xx
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python benchmarks/run.py --sqlite --smoke", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -40,7 +41,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python benchmarks/run.py --sqlite --smoke"
     )
 
 
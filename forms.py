@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +15,11 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -218,3 +223,14 @@ class ArtistForm(Form):
     )
 
 # TODO IMPLEMENT NEW ARTIST FORM AND NEW SHOW FORM
+
+# checks the create/edit handlers apply on top of the form validators,
+# shared with the bulk importer so every path accepts the same records
+def valid_contact(data):
+    return data['city'].isalpha() and data['state'].isalpha() and data['phone'].isnumeric()
+
+def clean_facebook_link(link):
+    # quick solution instead of using regex
+    if link and "www.facebook.com/" in link:
+        return link
+    return None
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+#----------------------------------------------------------------------------#
+# iCalendar (RFC 5545) export.
+#
+# Show times are naive local times, they are written as "floating" times that
+# calendar clients show in the reader's own time zone.
+#----------------------------------------------------------------------------#
+
+def escape_text(value):
+  return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+  # content lines are at most 75 octets, continuation lines start with a space
+  data = line.encode('utf-8')
+  chunks = []
+  while len(data) > 75:
+    cut = 75 if not chunks else 74
+    # never split a multi-byte character
+    while cut and (data[cut] & 0xC0) == 0x80:
+      cut -= 1
+    chunks.append(data[:cut])
+    data = data[cut:]
+  chunks.append(data)
+  return b'\r\n '.join(chunks).decode('utf-8')
+
+
+def to_ical(name, events):
+  # events are dicts with uid, start, duration (minutes), summary, url and updated_at (naive UTC)
+  lines = [
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    'PRODID:-//Fyyur//Show calendar//EN',
+    'CALSCALE:GREGORIAN',
+    f'X-WR-CALNAME:{escape_text(name)}',
+  ]
+  for event in events:
+    end = event['start'] + timedelta(minutes=event['duration'])
+    lines += [
+      'BEGIN:VEVENT',
+      f"UID:{event['uid']}",
+      f"DTSTAMP:{event['updated_at']:%Y%m%dT%H%M%SZ}",
+      f"DTSTART:{event['start']:%Y%m%dT%H%M%S}",
+      f'DTEND:{end:%Y%m%dT%H%M%S}',
+      f"SUMMARY:{escape_text(event['summary'])}",
+      f"URL:{event['url']}",
+      'END:VEVENT',
+    ]
+  lines.append('END:VCALENDAR')
+  return ''.join(fold(line) + '\r\n' for line in lines)
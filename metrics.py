@@ -0,0 +1,342 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+
+from flask import current_app, g, has_app_context, has_request_context, request, Response
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Prometheus collectors.
+#
+# A minimal in-process registry rendered in the Prometheus text format, so the
+# app does not need prometheus_client. Every worker process keeps its own numbers,
+# scrape each worker (or run a single one) to get the full picture.
+#----------------------------------------------------------------------------#
+
+def format_labels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ''
+  escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+  return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter(object):
+
+  def __init__(self, name, help, labels=()):
+    self.name = name
+    self.help = help
+    self.labels = labels
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def inc(self, labels=(), amount=1):
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0) + amount
+
+  def expose(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+    with self._lock:
+      for labels, value in sorted(self._values.items()):
+        lines.append(f'{self.name}{format_labels(self.labels, labels)} {value}')
+    return lines
+
+
+class Histogram(object):
+
+  def __init__(self, name, help, buckets, labels=()):
+    self.name = name
+    self.help = help
+    self.buckets = tuple(buckets)
+    self.labels = labels
+    # labels: ([count per bucket, the last one is +Inf], sum)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value, labels=()):
+    with self._lock:
+      counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0)
+      counts[bisect_left(self.buckets, value)] += 1
+      self._values[labels] = (counts, total + value)
+
+  def totals(self):
+    # (observations, sum) over every label set
+    with self._lock:
+      return sum(sum(counts) for counts, _ in self._values.values()), sum(total for _, total in self._values.values())
+
+  def expose(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+    with self._lock:
+      for labels, (counts, total) in sorted(self._values.items()):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+          cumulative += count
+          lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}')
+    return lines
+
+#----------------------------------------------------------------------------#
+# Template timing.
+#----------------------------------------------------------------------------#
+
+class TimedTemplate(Template):
+  # adds the time spent rendering to the current request's metrics. included and
+  # extended templates are rendered through their parent, they are not counted twice
+
+  def render(self, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+      return super().render(*args, **kwargs)
+    finally:
+      current = request_metrics()
+      if current is not None:
+        current['template_time'] += time.perf_counter() - start
+
+  def generate(self, *args, **kwargs):
+    # streamed pages (stream_template). the template may read lazy rows as it goes,
+    # the SQL time spent producing a piece is not counted as template time
+    pieces = super().generate(*args, **kwargs)
+    while True:
+      current = request_metrics()
+      start, sql_time = time.perf_counter(), current['sql_time'] if current else 0
+      try:
+        piece = next(pieces)
+      except StopIteration:
+        return
+      finally:
+        if current is not None:
+          current['template_time'] += time.perf_counter() - start - (current['sql_time'] - sql_time)
+      yield piece
+
+#----------------------------------------------------------------------------#
+# Repeated statements (N+1 queries).
+#
+# SQLAlchemy sends the same SQL text for every execution of a query, only the
+# bound parameters differ, so the statement string is its shape: one shape run
+# many times in one request is a query issued per row instead of once.
+#----------------------------------------------------------------------------#
+
+def repeated_statements(statements, threshold):
+  # [(statement, times), ...] for the statements executed at least `threshold` times
+  return [(statement, times) for statement, times in Tally(statements).most_common() if times >= threshold]
+
+
+class QueryRecorder(object):
+  # records every statement any engine executes while it is active
+  #
+  #   with QueryRecorder() as recorder:
+  #     client.get('/shows')
+  #   recorder.count, recorder.statements
+
+  def __init__(self):
+    self.statements = []
+
+  def __enter__(self):
+    event.listen(Engine, 'after_cursor_execute', self._record)
+    return self
+
+  def __exit__(self, *exc_info):
+    event.remove(Engine, 'after_cursor_execute', self._record)
+
+  def _record(self, conn, cursor, statement, parameters, context, executemany):
+    self.statements.append(statement)
+
+  @property
+  def count(self):
+    return len(self.statements)
+
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#----------------------------------------------------------------------------#
+
+def request_metrics():
+  # the counters of the request being handled, None outside of a request
+  if not has_app_context():
+    return None
+  return g.get('request_metrics')
+
+
+class Metrics(object):
+  # per request latency, SQL statement count/time (from engine events) and template
+  # render time. every request gets a Server-Timing header, the aggregates are served
+  # at /metrics and statements slower than SLOW_QUERY_MS are logged with their plan.
+  # with N_PLUS_ONE_THRESHOLD set (the development profile does), requests that run
+  # one statement that many times are logged and flagged with X-Repeated-Queries
+
+  LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+  QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+  def __init__(self, app=None):
+    self.requests = Counter('fyyur_http_requests_total', 'HTTP requests.', ('method', 'endpoint', 'status'))
+    self.latency = Histogram('fyyur_http_request_duration_seconds', 'Time to build a response.',
+                             self.LATENCY_BUCKETS, ('method', 'endpoint'))
+    self.sql_time = Histogram('fyyur_sql_duration_seconds', 'Time spent in SQL per request.',
+                              self.LATENCY_BUCKETS, ('endpoint',))
+    self.sql_queries = Histogram('fyyur_sql_queries_per_request', 'SQL statements executed per request.',
+                                 self.QUERY_BUCKETS, ('endpoint',))
+    self.template_time = Histogram('fyyur_template_render_seconds', 'Time spent rendering templates per request.',
+                                   self.LATENCY_BUCKETS, ('endpoint',))
+    self.slow_queries = Counter('fyyur_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ('endpoint',))
+    self.collectors = (self.requests, self.latency, self.sql_time, self.sql_queries, self.template_time, self.slow_queries)
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('SLOW_QUERY_MS', 250)
+    app.config.setdefault('SLOW_QUERY_EXPLAIN', True)
+    app.config.setdefault('SLOW_QUERY_LOG', None)
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', 0)
+    if not app.config['METRICS_ENABLED']:
+      return
+
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(self._start)
+    app.after_request(self._finish)
+    app.add_url_rule('/metrics', 'metrics', self.expose)
+
+    self.slow_log = app.logger
+    if app.config['SLOW_QUERY_LOG']:
+      self.slow_log = logging.getLogger('fyyur.slow_queries')
+      handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+      handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+      self.slow_log.addHandler(handler)
+      self.slow_log.setLevel(logging.INFO)
+
+    # on the Engine class, so every engine the app creates is covered
+    if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+      event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+  def _start(self):
+    g.request_metrics = {'start': time.perf_counter(), 'queries': 0, 'sql_time': 0.0, 'template_time': 0.0}
+    if current_app.config['N_PLUS_ONE_THRESHOLD']:
+      g.request_metrics['statements'] = []
+
+  def _finish(self, response):
+    current = g.get('request_metrics')
+    if current is None:
+      return response
+    labels = (request.method, request.endpoint or 'unmatched', str(response.status_code))
+    elapsed = time.perf_counter() - current['start']
+    response.headers['Server-Timing'] = ', '.join((
+      f"sql;dur={current['sql_time'] * 1000:.1f};desc=\"{current['queries']} queries\"",
+      f"tpl;dur={current['template_time'] * 1000:.1f}",
+      f'total;dur={elapsed * 1000:.1f}',
+    ))
+    if response.is_streamed:
+      # the body is rendered while it is sent, after this hook: the header only covers
+      # the time to the first byte, the collectors get the whole request once the last
+      # chunk is out
+      response.response = self._observe_when_sent(g._get_current_object(), labels, response.response)
+      return response
+    g.pop('request_metrics')
+    self._observe(current, labels, elapsed)
+    if 'statements' in current:
+      self._check_repeats(current_app._get_current_object(), current['statements'], labels[1], response)
+    return response
+
+  def _observe(self, current, labels, elapsed):
+    method, endpoint, status = labels
+    self.requests.inc((method, endpoint, status))
+    self.latency.observe(elapsed, (method, endpoint))
+    self.sql_time.observe(current['sql_time'], (endpoint,))
+    self.sql_queries.observe(current['queries'], (endpoint,))
+    self.template_time.observe(current['template_time'], (endpoint,))
+
+  def _observe_when_sent(self, state, labels, body):
+    # the request's counters stay in `state` (its g) while the body is sent, the
+    # statements run by the streamed view are added to them as usual
+    app = current_app._get_current_object()
+
+    def send():
+      try:
+        yield from body
+      finally:
+        if hasattr(body, 'close'):
+          body.close()
+        current = state.pop('request_metrics', None)
+        if current is not None:
+          self._observe(current, labels, time.perf_counter() - current['start'])
+          if 'statements' in current:
+            self._check_repeats(app, current['statements'], labels[1])
+
+    return send()
+
+  def _check_repeats(self, app, statements, endpoint, response=None):
+    # response is None once a streamed response has been sent, only the log is left
+    repeated = repeated_statements(statements, app.config['N_PLUS_ONE_THRESHOLD'])
+    if not repeated:
+      return
+    if response is not None:
+      response.headers['X-Repeated-Queries'] = str(len(repeated))
+    for statement, times in repeated:
+      app.logger.warning(f'possible N+1 query in {endpoint}: executed {times} times: {statement}')
+
+  def expose(self):
+    lines = []
+    for collector in self.collectors:
+      lines.extend(collector.expose())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+  def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    current = request_metrics()
+    if current is not None:
+      current['queries'] += 1
+      current['sql_time'] += elapsed
+      if 'statements' in current:
+        current['statements'].append(statement)
+    if has_app_context():
+      threshold = current_app.config['SLOW_QUERY_MS']
+      if threshold and elapsed * 1000 >= threshold:
+        self._log_slow_query(conn, cursor, statement, parameters, executemany, elapsed)
+
+  def _log_slow_query(self, conn, cursor, statement, parameters, executemany, elapsed):
+    endpoint = (request.endpoint if has_request_context() else None) or 'none'
+    self.slow_queries.inc((endpoint,))
+    message = f'slow query ({elapsed * 1000:.0f} ms, {endpoint}): {statement} {parameters!r}'
+    if (current_app.config['SLOW_QUERY_EXPLAIN'] and not executemany and conn.dialect.name == 'postgresql'
+        and statement.lstrip().upper().startswith(('SELECT', 'WITH'))):
+      message += '\n' + self._explain(cursor, statement, parameters)
+    self.slow_log.warning(message)
+
+  def _explain(self, cursor, statement, parameters):
+    # the plan of `statement`, or why there is none: this runs inside the request's
+    # query and must never fail it. plain EXPLAIN only plans the statement. it runs on
+    # a cursor of its own, so the one being read from is left alone, inside a
+    # savepoint so that a failure does not abort the request's transaction
+    try:
+      explain = cursor.connection.cursor()
+    except Exception as error:
+      return f'(EXPLAIN failed: {error})'
+    try:
+      explain.execute('SAVEPOINT slow_query_explain')
+      try:
+        explain.execute('EXPLAIN ' + statement, parameters)
+        plan = '\n'.join(row[0] for row in explain.fetchall())
+      except Exception as error:
+        explain.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+        return f'(EXPLAIN failed: {error})'
+      explain.execute('RELEASE SAVEPOINT slow_query_explain')
+      return plan
+    except Exception as error:
+      # the savepoint itself failed (e.g. the connection is gone), the error
+      # resurfaces on the request's own next statement if it matters
+      return f'(EXPLAIN failed: {error})'
+    finally:
+      try:
+        explain.close()
+      except Exception:
+        pass
+
+
+metrics = Metrics()
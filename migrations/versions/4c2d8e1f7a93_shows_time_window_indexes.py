@@ -0,0 +1,32 @@
+"""shows time window indexes
+
+Revision ID: 4c2d8e1f7a93
+Revises: b3e91c7a4f20
+Create Date: 2026-10-18 11:02:47.915306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2d8e1f7a93'
+down_revision = 'b3e91c7a4f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (venue_id, dt) and (artist_id, dt) serve the per venue/artist past/upcoming
+    # split of the detail pages, (dt, id) serves the keyset paginated /shows feed
+    # and its "upcoming only" filter (a partial index on dt > now() is not possible,
+    # index predicates must be immutable)
+    op.create_index('ix_shows_venue_id_dt', 'shows', ['venue_id', 'dt'], unique=False)
+    op.create_index('ix_shows_artist_id_dt', 'shows', ['artist_id', 'dt'], unique=False)
+    op.create_index('ix_shows_dt_id', 'shows', ['dt', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_dt_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_dt', table_name='shows')
+    op.drop_index('ix_shows_venue_id_dt', table_name='shows')
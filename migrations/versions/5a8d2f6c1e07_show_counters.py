@@ -0,0 +1,34 @@
+"""show counters
+
+Revision ID: 5a8d2f6c1e07
+Revises: 9f1b6c3e2d58
+Create Date: 2026-10-18 14:12:05.318470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8d2f6c1e07'
+down_revision = '9f1b6c3e2d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_show_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_show_count', sa.Integer(), nullable=False, server_default='0'))
+        # backfill, show times are naive local times like datetime.now() in the app
+        op.execute(f'''
+            UPDATE {table} SET
+                upcoming_show_count = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id AND shows.dt > LOCALTIMESTAMP),
+                past_show_count = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id AND shows.dt <= LOCALTIMESTAMP)
+        ''')
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_show_count')
+        op.drop_column(table, 'upcoming_show_count')
@@ -0,0 +1,28 @@
+"""updated_at columns
+
+Revision ID: 9f1b6c3e2d58
+Revises: e7a0b5d2c416
+Create Date: 2026-10-18 12:31:19.604432
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f1b6c3e2d58'
+down_revision = 'e7a0b5d2c416'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows are stamped with the time of the migration
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in ('shows', 'artists', 'venues'):
+        op.drop_column(table, 'updated_at')
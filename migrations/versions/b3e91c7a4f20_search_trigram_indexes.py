@@ -0,0 +1,35 @@
+"""search trigram indexes
+
+Revision ID: b3e91c7a4f20
+Revises: d1c37654a000
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e91c7a4f20'
+down_revision = 'd1c37654a000'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm lets the GIN indexes answer ILIKE '%term%' lookups,
+    # the btree indexes serve the ORDER BY name of the paginated results
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venues_name_trgm', 'venues', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artists_name_trgm', 'artists', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_venues_name', 'venues', ['name'], unique=False)
+    op.create_index('ix_artists_name', 'artists', ['name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artists_name', table_name='artists')
+    op.drop_index('ix_venues_name', table_name='venues')
+    op.drop_index('ix_artists_name_trgm', table_name='artists')
+    op.drop_index('ix_venues_name_trgm', table_name='venues')
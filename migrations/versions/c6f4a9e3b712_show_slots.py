@@ -0,0 +1,40 @@
+"""show durations and double booking constraints
+
+Revision ID: c6f4a9e3b712
+Revises: 5a8d2f6c1e07
+Create Date: 2026-10-18 15:03:41.772019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f4a9e3b712'
+down_revision = '5a8d2f6c1e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # btree_gist provides the GiST "=" operator class on integers the constraints combine with "&&".
+    # creating the constraints fails if existing shows already overlap, list them with
+    #   SELECT a.id, b.id FROM shows a JOIN shows b ON a.id < b.id
+    #   AND (a.venue_id = b.venue_id OR a.artist_id = b.artist_id) AND a.slot && b.slot;
+    # after the columns are added, and fix their times or durations first
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('shows', sa.Column('duration', sa.Integer(), nullable=False, server_default='120'))
+    op.add_column('shows', sa.Column('slot', postgresql.TSRANGE(),
+                                     sa.Computed("tsrange(dt, dt + duration * interval '1 minute')")))
+    op.create_check_constraint('ck_shows_duration', 'shows', 'duration > 0')
+    op.create_exclude_constraint('ex_shows_venue_id_slot', 'shows', ('venue_id', '='), ('slot', '&&'), using='gist')
+    op.create_exclude_constraint('ex_shows_artist_id_slot', 'shows', ('artist_id', '='), ('slot', '&&'), using='gist')
+
+
+def downgrade():
+    op.drop_constraint('ex_shows_artist_id_slot', 'shows')
+    op.drop_constraint('ex_shows_venue_id_slot', 'shows')
+    op.drop_constraint('ck_shows_duration', 'shows')
+    op.drop_column('shows', 'slot')
+    op.drop_column('shows', 'duration')
@@ -0,0 +1,57 @@
+"""genres as arrays
+
+Revision ID: e7a0b5d2c416
+Revises: 4c2d8e1f7a93
+Create Date: 2026-10-18 11:48:05.227693
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a0b5d2c416'
+down_revision = '4c2d8e1f7a93'
+branch_labels = None
+depends_on = None
+
+
+# existing rows hold the text form of the list the forms submitted, e.g. {Jazz,"Musical Theatre"},
+# which postgres parses back as an array literal. anything else is treated as a comma separated list
+TO_ARRAY = """
+    CASE
+        WHEN genres IS NULL THEN NULL
+        WHEN btrim(genres) = '' THEN '{}'::varchar[]
+        WHEN left(btrim(genres), 1) = '{' THEN btrim(genres)::varchar[]
+        ELSE string_to_array(genres, ',')::varchar[]
+    END
+"""
+
+
+def upgrade():
+    op.alter_column('venues', 'genres',
+               existing_type=sa.VARCHAR(),
+               type_=postgresql.ARRAY(sa.String()),
+               postgresql_using=TO_ARRAY)
+    op.alter_column('artists', 'genres',
+               existing_type=sa.VARCHAR(length=120),
+               type_=postgresql.ARRAY(sa.String()),
+               existing_nullable=False,
+               postgresql_using=TO_ARRAY)
+    op.create_index('ix_venues_genres', 'venues', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artists_genres', 'artists', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
+    op.alter_column('artists', 'genres',
+               existing_type=postgresql.ARRAY(sa.String()),
+               type_=sa.VARCHAR(length=120),
+               existing_nullable=False,
+               postgresql_using='genres::varchar')
+    op.alter_column('venues', 'genres',
+               existing_type=postgresql.ARRAY(sa.String()),
+               type_=sa.VARCHAR(),
+               postgresql_using='genres::varchar')
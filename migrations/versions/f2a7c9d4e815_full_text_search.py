@@ -0,0 +1,55 @@
+"""full text search vectors
+
+Revision ID: f2a7c9d4e815
+Revises: c6f4a9e3b712
+Create Date: 2026-10-18 16:20:54.106337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7c9d4e815'
+down_revision = 'c6f4a9e3b712'
+branch_labels = None
+depends_on = None
+
+
+# the name weighs most, then where and what is played, then the seeking text.
+# array_to_string() is not immutable, which rules out a generated column
+SEARCH_VECTOR_UPDATE = '''
+CREATE OR REPLACE FUNCTION search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(array_to_string(NEW.genres, ' '), '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.seeking_desc, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+'''
+
+
+def upgrade():
+    op.execute(SEARCH_VECTOR_UPDATE)
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute(f'''
+            CREATE TRIGGER {table}_search_vector_update
+            BEFORE INSERT OR UPDATE OF name, city, state, genres, seeking_desc ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE search_vector_update()
+        ''')
+        # fires the trigger on every existing row
+        op.execute(f'UPDATE {table} SET name = name')
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        op.execute(f'DROP TRIGGER {table}_search_vector_update ON {table}')
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION search_vector_update()')
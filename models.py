@@ -0,0 +1,171 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from sqlalchemy import text, select, func, and_, or_, FetchedValue, JSON
+from sqlalchemy.dialects.postgresql import ARRAY, TSRANGE, TSVECTOR, ExcludeConstraint
+from replicas import RoutingSQLAlchemy
+
+# GET requests read from the replicas in SQLALCHEMY_REPLICA_URIS when there are any
+db = RoutingSQLAlchemy()
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+# updated_at columns are naive UTC, like datetime.utcnow()
+UTC_NOW = text("timezone('utc', now())")
+
+class Venue(db.Model):
+  __tablename__ = 'venues'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String, nullable=False)
+  city = db.Column(db.String(120), nullable=False)
+  state = db.Column(db.String(120), nullable=False)
+  address = db.Column(db.String(120), nullable=False)
+  phone = db.Column(db.String(120), nullable=False)
+  image_link = db.Column(db.String(500))
+  facebook_link = db.Column(db.String(120))
+  seeking = db.Column(db.Boolean, nullable=False, default=True)
+  seeking_desc = db.Column(db.String())
+  website = db.Column(db.String())
+  genres = db.Column(ARRAY(db.String()))
+  updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=UTC_NOW)
+  # maintained by refresh_show_counts()
+  upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  # name, city, state, genres and seeking_desc, written by the search_vector_update trigger
+  search_vector = db.deferred(db.Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
+  shows = db.relationship('Show', backref='venue', cascade="all, delete")
+
+  __table_args__ = (
+    db.Index('ix_venues_name', 'name'),
+    db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+    db.Index('ix_venues_search_vector', 'search_vector', postgresql_using='gin'),
+  )
+
+  def __repr__(self):
+    return f"<Venue {self.id}, {self.name}, {self.city}>"
+
+  # OK TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+class Artist(db.Model):
+  __tablename__ = 'artists'
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String, nullable=False)
+  city = db.Column(db.String(120), nullable=False)
+  state = db.Column(db.String(120), nullable=False)
+  phone = db.Column(db.String(120), nullable=False)
+  genres = db.Column(ARRAY(db.String()), nullable=False)
+  image_link = db.Column(db.String(500))
+  facebook_link = db.Column(db.String(120))
+  seeking = db.Column(db.Boolean, nullable=False, default=True)
+  seeking_desc = db.Column(db.String())
+  website = db.Column(db.String())
+  updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=UTC_NOW)
+  # maintained by refresh_show_counts()
+  upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  # name, city, state, genres and seeking_desc, written by the search_vector_update trigger
+  search_vector = db.deferred(db.Column(TSVECTOR, server_default=FetchedValue(), server_onupdate=FetchedValue()))
+  shows = db.relationship('Show', backref='artist', cascade="all, delete")
+
+  __table_args__ = (
+    db.Index('ix_artists_name', 'name'),
+    db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+    db.Index('ix_artists_search_vector', 'search_vector', postgresql_using='gin'),
+  )
+
+  # OK TODO: implement any missing fields, as a database migration using Flask-Migrate
+
+# OK TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+class Show(db.Model):
+  __tablename__ = 'shows'
+
+  id = db.Column(db.Integer, primary_key=True)
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='cascade'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='cascade'), nullable=False)
+  dt = db.Column(db.DateTime(), nullable=False)
+  # length of the show in minutes
+  duration = db.Column(db.Integer, nullable=False, default=120, server_default='120')
+  # [dt, dt + duration) computed by the database. dt is a naive local time, hence a
+  # tsrange and not a tstzrange
+  slot = db.Column(TSRANGE, db.Computed("tsrange(dt, dt + duration * interval '1 minute')"))
+  updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=UTC_NOW)
+
+  __table_args__ = (
+    db.Index('ix_shows_venue_id_dt', 'venue_id', 'dt'),
+    db.Index('ix_shows_artist_id_dt', 'artist_id', 'dt'),
+    db.Index('ix_shows_dt_id', 'dt', 'id'),
+    # no two shows of a venue, or of an artist, may overlap (needs btree_gist). the
+    # GiST indexes behind the constraints also serve the availability lookups
+    db.CheckConstraint('duration > 0', name='ck_shows_duration'),
+    ExcludeConstraint(('venue_id', '='), ('slot', '&&'), name='ex_shows_venue_id_slot', using='gist'),
+    ExcludeConstraint(('artist_id', '='), ('slot', '&&'), name='ex_shows_artist_id_slot', using='gist'),
+  )
+
+  # the name of the constraint a double booking violates, and what to tell the user
+  CONFLICTS = {
+    'ex_shows_venue_id_slot': 'The venue is already booked at that time',
+    'ex_shows_artist_id_slot': 'The artist is already booked at that time',
+  }
+
+def booking_conflict(error):
+  # the message for an IntegrityError raised by a double booking, None for any other violation
+  constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+  return Show.CONFLICTS.get(constraint)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+def refresh_show_counts(model, *criteria):
+  # recounts the upcoming/past shows of the venues or artists matching `criteria`
+  # (all of them without criteria) with one UPDATE, each count is a range scan of
+  # the (venue_id, dt)/(artist_id, dt) index. called in the same transaction as
+  # every write to shows, and periodically with `upcoming_show_count > 0` to move
+  # shows that have started from the upcoming to the past count.
+  # returns the number of rows whose counts changed
+  fk = Show.venue_id if model is Venue else Show.artist_id
+  now = datetime.now()
+  upcoming = select([func.count(Show.id)]).where(and_(fk == model.id, Show.dt > now)).as_scalar()
+  past = select([func.count(Show.id)]).where(and_(fk == model.id, Show.dt <= now)).as_scalar()
+  table = model.__table__
+  statement = table.update().where(and_(
+    *criteria,
+    or_(table.c.upcoming_show_count != upcoming, table.c.past_show_count != past)
+  )).values(
+    upcoming_show_count=upcoming,
+    past_show_count=past,
+    # the counts are derived data, they do not bump the row's updated_at
+    updated_at=table.c.updated_at
+  )
+  return db.session.execute(statement).rowcount
+
+#----------------------------------------------------------------------------#
+# SQLite stand-in.
+#----------------------------------------------------------------------------#
+
+def use_sqlite(metadata):
+  # rewrites the postgres specific parts of the schema, the stand-in is created with
+  # create_all(). for the benchmarks and the tests, postgres numbers are the ones that matter
+  for table in metadata.tables.values():
+    for column in table.c:
+      if isinstance(column.type, (ARRAY, TSRANGE, TSVECTOR)):
+        column.type = JSON()
+      if column.computed is not None:
+        column.computed = None
+        column.server_default = None
+      if column.server_default is not None and 'timezone' in str(getattr(column.server_default, 'arg', '')):
+        column.server_default = None
+    for constraint in list(table.constraints):
+      if isinstance(constraint, ExcludeConstraint):
+        table.constraints.discard(constraint)
+    for index in list(table.indexes):
+      if index.dialect_options['postgresql'].get('using'):
+        table.indexes.discard(index)
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import tuple_
+
+from models import Show
+
+#----------------------------------------------------------------------------#
+# Request arguments.
+#----------------------------------------------------------------------------#
+
+def parse_date(value):
+  # used as a `type` for request.args, a ValueError makes werkzeug fall back to the default
+  return datetime.strptime(value, '%Y-%m-%d')
+
+def parse_month(value):
+  # ?month=YYYY-MM, the first day of the month. the months before and after it
+  # must be four digit years too, the calendar links to them
+  month = datetime.strptime(value, '%Y-%m')
+  if not 1000 < month.year < 9999:
+    raise ValueError(f'month out of range: {value}')
+  return month
+
+def month_bounds(month):
+  # [first day of the month, first day of the next month)
+  next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+  return month, next_month
+
+def show_filters(args):
+  # the "upcoming only" and date window filters shared by /shows and the API
+  return {
+    'upcoming': args.get('upcoming', 0, type=int),
+    'from': args.get('from', type=parse_date),
+    'to': args.get('to', type=parse_date)
+  }
+
+#----------------------------------------------------------------------------#
+# Uncounted pages.
+#----------------------------------------------------------------------------#
+
+class PageWithoutCount(object):
+  # the page/prev/next part of Flask-SQLAlchemy's Pagination for a page that was
+  # fetched with one row more than per_page: the extra row tells whether a next page
+  # exists, so the matches are never counted. `total` is only known on the last page
+  # (None before it)
+
+  def __init__(self, page, per_page, rows):
+    self.page = page
+    self.per_page = per_page
+    self.has_next = len(rows) > per_page
+    self.items = rows[:per_page]
+    self.has_prev = page > 1
+    self.prev_num = page - 1 if self.has_prev else None
+    self.next_num = page + 1 if self.has_next else None
+    self.total = None if self.has_next else (page - 1) * per_page + len(self.items)
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+def encode_cursor(dt, id):
+  # keyset pagination cursor, the (dt, id) of the last row of a page
+  return f'{dt.isoformat()}_{id}'
+
+def decode_cursor(cursor):
+  # raises ValueError for a malformed cursor
+  if not cursor:
+    return None
+  dt, _, id = cursor.rpartition('_')
+  return datetime.fromisoformat(dt), int(id)
+
+def show_conditions(filters, after):
+  # the filters and the decoded cursor `after` as WHERE clauses on shows, for a Query
+  # (filter_shows) or a Core select (the async app)
+  conditions = []
+  if filters['upcoming']:
+    conditions.append(Show.dt > datetime.now())
+  if filters['from']:
+    conditions.append(Show.dt >= filters['from'])
+  if filters['to']:
+    conditions.append(Show.dt < filters['to'] + timedelta(days=1))
+  if after:
+    conditions.append(tuple_(Show.dt, Show.id) > after)
+  return conditions
+
+def filter_shows(query, filters, after):
+  # `query` (which selects from shows and has Show.dt and Show.id among its columns)
+  # narrowed to the filters, ordered by (dt, id) and continuing after the decoded
+  # cursor `after`. every page is a range scan of the (dt, id) index no matter how deep it is
+  return query.filter(*show_conditions(filters, after)).order_by(Show.dt, Show.id)
+
+def page_shows(query, filters, after, per_page):
+  # one page of filter_shows(), returns the rows and the cursor of the next page,
+  # None on the last one
+  rows = filter_shows(query, filters, after).limit(per_page + 1).all()
+
+  if len(rows) <= per_page:
+    return rows, None
+  rows = rows[:per_page]
+  return rows, encode_cursor(rows[-1].dt, rows[-1].id)
+
+def stream_shows(query, filters, after, per_page, chunk_size):
+  # page_shows() for streamed pages: the rows are read from a server-side cursor,
+  # chunk_size at a time, while they are iterated. returns the rows and a function
+  # giving the cursor of the next page, which is only known once the rows are consumed
+  rows = filter_shows(query, filters, after).limit(per_page + 1).yield_per(chunk_size)
+  next_cursor = []
+
+  def page():
+    last = None
+    for number, row in enumerate(rows):
+      if number == per_page:
+        next_cursor.append(encode_cursor(last.dt, last.id))
+        break
+      last = row
+      yield row
+
+  return page(), lambda: next_cursor[0] if next_cursor else None
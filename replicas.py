@@ -0,0 +1,161 @@
+import logging
+import random
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger('fyyur.replicas')
+
+READ_METHODS = ('GET', 'HEAD')
+# set after a write, the value is the time (epoch seconds) until which the client reads from the primary
+STICKY_COOKIE = 'fyyur_primary_until'
+
+# 0 while a standby has replayed everything it received, the age of the last replayed
+# transaction otherwise. NULL on a primary
+REPLICATION_LAG = text("""
+  SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+              ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END
+""")
+
+#----------------------------------------------------------------------------#
+# Health checks.
+#----------------------------------------------------------------------------#
+
+class Replicas(object):
+  # the replica binds of one app and whether each of them is usable. a replica is
+  # checked (SELECT 1, or its replication lag on postgres) at most every
+  # REPLICA_CHECK_INTERVAL seconds, lazily by the request that needs it. a replica
+  # whose connection drops mid-query is taken out until its next check
+
+  def __init__(self, binds, check_interval, max_lag):
+    self.binds = binds
+    self.check_interval = check_interval
+    self.max_lag = max_lag
+    self._healthy = {}
+    self._checked = {}
+    self._watched = set()
+    self._lock = threading.Lock()
+
+  def choose(self, db):
+    # a random healthy replica, None when none is
+    healthy = [bind for bind in self.binds if self.is_healthy(db, bind)]
+    return random.choice(healthy) if healthy else None
+
+  def is_healthy(self, db, bind):
+    now = time.monotonic()
+    with self._lock:
+      due = now - self._checked.get(bind, float('-inf')) >= self.check_interval
+      if due:
+        # claimed by this thread, the others keep the previous result meanwhile
+        self._checked[bind] = now
+    if due:
+      self._healthy[bind] = self.check(db.get_engine(bind=bind), bind)
+    return self._healthy.get(bind, False)
+
+  def check(self, engine, bind):
+    if bind not in self._watched:
+      self._watched.add(bind)
+      event.listen(engine, 'handle_error', lambda context: self._on_error(bind, context))
+    try:
+      with engine.connect() as connection:
+        if self.max_lag and engine.dialect.name == 'postgresql':
+          lag = connection.execute(REPLICATION_LAG).scalar()
+          if lag is not None and lag > self.max_lag:
+            logger.warning(f'replica {bind} is {lag:.1f}s behind, reading from the primary')
+            return False
+        else:
+          connection.execute(text('SELECT 1'))
+      return True
+    except DBAPIError as error:
+      logger.warning(f'replica {bind} is unavailable: {error}')
+      return False
+
+  def _on_error(self, bind, context):
+    if context.is_disconnect:
+      logger.warning(f'lost the connection to replica {bind}')
+      self._healthy[bind] = False
+
+#----------------------------------------------------------------------------#
+# Session routing.
+#----------------------------------------------------------------------------#
+
+def primary_only():
+  # True outside of GET/HEAD requests and for clients that wrote recently
+  if not has_request_context() or request.method not in READ_METHODS:
+    return True
+  try:
+    return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+  except ValueError:
+    return False
+
+
+class RoutingSession(SignallingSession):
+  # sends the statements of GET/HEAD requests to a replica, everything else to the
+  # primary. a session that has flushed or executed an INSERT/UPDATE/DELETE stays on
+  # the primary, and so does a session that has already read from it, so one request
+  # never mixes the two. the replica is picked once per session (i.e. per request)
+
+  def __init__(self, db, **options):
+    self._db = db
+    self._replica = None
+    self._primary = False
+    super().__init__(db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    writing = self._flushing or isinstance(clause, UpdateBase)
+    if not self._primary and self._replica is None:
+      replicas = self.app.extensions.get('replicas')
+      if replicas is not None and not writing and not primary_only():
+        self._replica = replicas.choose(self._db)
+        # read by the response cache, see Cache.cached
+        g.read_replica = self._replica
+      if self._replica is None:
+        self._primary = True
+    elif self._replica is not None and writing:
+      raise RuntimeError('a write was attempted on a session reading from a replica')
+    if self._replica is not None:
+      return self._db.get_engine(self.app, bind=self._replica)
+    if writing and has_request_context():
+      # only an actual write makes the client read from the primary, not every POST
+      # (e.g. a form that failed validation)
+      g.wrote_primary = True
+    return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  # SQLAlchemy with read replicas. SQLALCHEMY_REPLICA_URIS become the binds
+  # replica_0, replica_1, ... (they share SQLALCHEMY_ENGINE_OPTIONS with the primary,
+  # so use the same kind of database for both). without replicas it behaves like
+  # the stock extension
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def init_app(self, app):
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+    app.config.setdefault('REPLICA_CHECK_INTERVAL', 10)
+    app.config.setdefault('REPLICA_MAX_LAG_SECONDS', 5)
+    super().init_app(app)
+
+    uris = app.config['SQLALCHEMY_REPLICA_URIS']
+    if not uris:
+      return
+    binds = [f'replica_{number}' for number in range(len(uris))]
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **dict(zip(binds, uris)))
+    app.extensions['replicas'] = Replicas(binds, app.config['REPLICA_CHECK_INTERVAL'],
+                                          app.config['REPLICA_MAX_LAG_SECONDS'])
+    app.after_request(self._stick_to_primary)
+
+  def _stick_to_primary(self, response):
+    # read-your-writes: a client that just wrote reads from the primary until the
+    # replicas have caught up
+    if g.pop('wrote_primary', False):
+      seconds = current_app.config['REPLICA_STICKY_SECONDS']
+      response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax')
+    return response
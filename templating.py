@@ -0,0 +1,79 @@
+import os
+import time
+
+from flask import Response, current_app, get_flashed_messages, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Compiled template cache.
+#
+# Jinja compiles every template to Python code the first time a worker renders
+# it. With TEMPLATE_CACHE_DIR set, the compiled code is kept on disk and shared
+# by every worker: `flask compile-templates` fills it at build time, so workers
+# only unmarshal it. A template whose source changed is recompiled, the cache is
+# keyed on the source checksum. With TEMPLATE_PRELOAD every template is loaded
+# when the app starts, so no request pays for it.
+#
+# The Quart app's environment compiles templates to async code, which the Flask
+# app cannot run and vice versa: it keeps its files in an async/ subdirectory.
+#----------------------------------------------------------------------------#
+
+def init_templates(app):
+  # works for the Flask and the Quart app alike, both have a Jinja environment
+  app.config.setdefault('TEMPLATE_CACHE_DIR', None)
+  app.config.setdefault('TEMPLATE_PRELOAD', False)
+  directory = app.config['TEMPLATE_CACHE_DIR']
+  if directory:
+    if app.jinja_env.is_async:
+      directory = os.path.join(directory, 'async')
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+  if app.config['TEMPLATE_PRELOAD']:
+    start = time.perf_counter()
+    count = load_templates(app.jinja_env)
+    app.logger.debug(f'{count} templates loaded in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+def template_names(env):
+  return env.list_templates(extensions=['html'])
+
+def load_templates(env):
+  # loads (and compiles, unless the bytecode cache has them) every template into
+  # the environment's template cache. returns how many there are
+  names = template_names(env)
+  for name in names:
+    env.get_template(name)
+  return len(names)
+
+def compile_templates(env, clear=False):
+  # (re)builds the bytecode cache of env, returns the number of templates compiled
+  if env.bytecode_cache is None:
+    raise RuntimeError('TEMPLATE_CACHE_DIR is not set')
+  if clear:
+    env.bytecode_cache.clear()
+  # loaded templates are not looked up in the bytecode cache again
+  if env.cache is not None:
+    env.cache.clear()
+  return load_templates(env)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+# template output pieces per chunk sent, jinja yields every piece of markup between
+# two tags separately
+STREAM_BUFFER_SIZE = 64
+
+def stream_template(template_name, **context):
+  # render_template() that sends the page while it is rendered (Flask 1.1 has no
+  # stream_template). the request context stays around until the last chunk, so the
+  # context may hold lazy rows that are only read from the database as the template
+  # gets to them. the page is sent as it is rendered, an error half way through
+  # cuts it short instead of showing the error page
+  app = current_app._get_current_object()
+  app.update_template_context(context)
+  # the session is saved before the body is rendered: the flashes the layout shows
+  # are taken out of it now, get_flashed_messages() keeps them for the request
+  get_flashed_messages()
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(STREAM_BUFFER_SIZE)
+  return Response(stream_with_context(stream))
@@ -0,0 +1,75 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+from flask_migrate import upgrade, downgrade
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from metrics import QueryRecorder, repeated_statements
+from models import db, use_sqlite
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+#----------------------------------------------------------------------------#
+# pytest fixtures.
+#
+# Enable them with `pytest -p testing`, or `pytest_plugins = ['testing']` in a
+# conftest.py (the one at the top of the repo does). The app runs with the
+# 'testing' profile (TEST_DATABASE_URL, no response cache, so every request
+# really hits the database). The schema is built once per run, by the migrations
+# on postgres and with create_all() on a SQLite stand-in
+# (TEST_DATABASE_URL=sqlite://), and dropped at the end: point TEST_DATABASE_URL
+# at a database of its own.
+#
+#   def test_shows_page(client, query_budget):
+#     with query_budget(1):
+#       client.get('/shows').get_data()
+#----------------------------------------------------------------------------#
+
+@pytest.fixture(scope='session')
+def app():
+  app = create_app('testing')
+  with app.app_context():
+    try:
+      db.engine.connect().close()
+    except OperationalError as error:
+      pytest.skip(f'the test database is unavailable: {error}')
+    sqlite = db.engine.dialect.name == 'sqlite'
+    if sqlite:
+      use_sqlite(db.metadata)
+      db.create_all(bind=None)
+    else:
+      upgrade(MIGRATIONS)
+  # no app context while the tests run, each request pushes its own
+  yield app
+  with app.app_context():
+    db.session.remove()
+    if sqlite:
+      db.drop_all(bind=None)
+    else:
+      downgrade(MIGRATIONS, 'base')
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def query_budget():
+  # fails the test when the block runs more than `max_queries` statements, or runs
+  # any statement more than `max_repeats` times (a query per row). read streamed
+  # bodies inside the block, their queries run while they are sent
+  @contextmanager
+  def budget(max_queries, max_repeats=1):
+    with QueryRecorder() as recorder:
+      yield recorder
+    problems = []
+    if recorder.count > max_queries:
+      problems.append(f'{recorder.count} statements executed, the budget is {max_queries}')
+    for statement, times in repeated_statements(recorder.statements, max_repeats + 1):
+      problems.append(f'executed {times} times: {statement}')
+    if problems:
+      pytest.fail('\n'.join(problems + ['statements:'] + recorder.statements), pytrace=False)
+  return budget
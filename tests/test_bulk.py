@@ -0,0 +1,42 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from bulk import export_rows, import_rows, read_rows
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Export and import.
+#
+# A dump made by `flask export` loads back with `flask import-data`.
+#----------------------------------------------------------------------------#
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl'])
+def test_shows_round_trip(app, format):
+  now = datetime.now().replace(microsecond=0)
+  with app.app_context():
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street',
+                  phone='415-000-0000', genres=['Jazz'])
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', phone='415-000-0000', genres=['Rock'])
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add_all(
+      Show(venue_id=venue.id, artist_id=artist.id, dt=now + timedelta(days=days)) for days in range(-10, 10)
+    )
+    db.session.commit()
+    try:
+      dump = ''.join(export_rows('shows', format))
+      starts = sorted(show.dt for show in Show.query)
+      Show.query.delete()
+      db.session.commit()
+
+      report = import_rows('shows', read_rows(io.StringIO(dump), format))
+      assert report == {'inserted': 20, 'errors': []}
+      assert sorted(show.dt for show in Show.query) == starts
+    finally:
+      db.session.rollback()
+      Show.query.delete()
+      Venue.query.delete()
+      Artist.query.delete()
+      db.session.commit()
@@ -0,0 +1,28 @@
+from cache import LRUCache
+
+#----------------------------------------------------------------------------#
+# LRUCache.
+#----------------------------------------------------------------------------#
+
+def page(size):
+  return (b'x' * size, 200, [('Content-Type', 'text/html; charset=utf-8')])
+
+
+def test_bounded_by_size():
+  # pages stored under junk query strings evict the least recently used ones
+  cache = LRUCache(max_entries=1024, max_size=10000)
+  cache.incr('version:venues')
+  for n in range(100):
+    cache.set(f'view:1:/venues?junk={n}', page(1000))
+    assert cache.size <= 10000
+  assert cache.get('view:1:/venues?junk=0') is None
+  assert cache.get('view:1:/venues?junk=99') is not None
+  assert cache.counter('version:venues') == 1
+
+
+def test_oversized_value_not_stored():
+  cache = LRUCache(max_size=10000)
+  cache.set('view:1:/venues', page(100))
+  cache.set('view:1:/venues', page(20000))
+  assert cache.get('view:1:/venues') is None
+  assert cache.size == 0
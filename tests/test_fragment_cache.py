@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from jinja2 import Environment
+
+from cache import FragmentCacheExtension, LRUCache
+
+TEMPLATE = "{% for id in ids %}{% cache ['tile', id] %}<li>{{ id }} {{ label }}</li>{% endcache %}{% endfor %}"
+
+
+def environment(enable_async):
+  env = Environment(extensions=[FragmentCacheExtension], enable_async=enable_async)
+  env.fragment_cache = LRUCache()
+  return env
+
+
+def render(env, source=TEMPLATE, **context):
+  template = env.from_string(source)
+  if env.is_async:
+    return asyncio.new_event_loop().run_until_complete(template.render_async(**context))
+  return template.render(**context)
+
+
+@pytest.mark.parametrize('enable_async', [False, True])
+def test_fragment_is_rendered_and_cached(enable_async):
+  env = environment(enable_async)
+  assert render(env, ids=[1, 2], label='first') == '<li>1 first</li><li>2 first</li>'
+  assert env.fragment_cache.get('fragment:tile:1') == '<li>1 first</li>'
+  # served from the cache, the new label is not rendered
+  assert render(env, ids=[1, 3], label='second') == '<li>1 first</li><li>3 second</li>'
+
+
+@pytest.mark.parametrize('enable_async', [False, True])
+def test_undefined_key_is_not_cached(enable_async):
+  env = environment(enable_async)
+  html = render(env, '{% cache [missing] %}<p>{{ label }}</p>{% endcache %}', label='x')
+  assert html == '<p>x</p>'
+  assert not env.fragment_cache._entries
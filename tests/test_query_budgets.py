@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Venue, Artist, Show, refresh_show_counts
+
+#----------------------------------------------------------------------------#
+# Query budgets.
+#
+# The statements each read page may run, whatever the number of rows it shows:
+# a page over budget, or running one statement more than once, issues a query
+# per row again.
+#----------------------------------------------------------------------------#
+
+@pytest.fixture(scope='module')
+def catalogue(app):
+  # three venues and three artists, every artist playing every venue twice, once
+  # in the past and once ahead
+  now = datetime.now().replace(minute=0, second=0, microsecond=0)
+  with app.app_context():
+    venues = [
+      Venue(name=name, city='San Francisco', state='CA', address=f'{number} Main St', phone='415-000-0000',
+            genres=['Jazz', 'Rock'])
+      for number, name in enumerate(['The Musical Hop', 'Park Square Live Music', 'The Dueling Pianos Bar'])
+    ]
+    artists = [
+      Artist(name=name, city='San Francisco', state='CA', phone='415-000-0000', genres=['Jazz'])
+      for name in ['Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band']
+    ]
+    db.session.add_all(venues + artists)
+    db.session.flush()
+    db.session.add_all(
+      Show(venue_id=venue.id, artist_id=artist.id, dt=now + timedelta(days=days * (3 * v + a + 1)))
+      for v, venue in enumerate(venues) for a, artist in enumerate(artists) for days in (-1, 1)
+    )
+    # the counts are refreshed with UPDATE statements, which do not autoflush
+    db.session.flush()
+    refresh_show_counts(Venue)
+    refresh_show_counts(Artist)
+    db.session.commit()
+    assert [(venue.upcoming_show_count, venue.past_show_count) for venue in venues] == [(3, 3)] * 3
+    ids = {'venue_id': venues[0].id, 'artist_id': artists[0].id}
+  # outside of the app context, or the requests would share it (and its session)
+  yield ids
+  with app.app_context():
+    Show.query.delete()
+    Venue.query.delete()
+    Artist.query.delete()
+    db.session.commit()
+
+
+def test_shows(client, catalogue, query_budget):
+  with query_budget(1):
+    response = client.get('/shows')
+    body = response.get_data(as_text=True)
+  assert response.status_code == 200
+  assert body.count('The Wild Sax Band') == 6
+
+
+def test_upcoming_shows(client, catalogue, query_budget):
+  with query_budget(1):
+    response = client.get('/shows?upcoming=1')
+    body = response.get_data(as_text=True)
+  assert response.status_code == 200
+  assert body.count('The Wild Sax Band') == 3
+
+
+def test_venue(client, catalogue, query_budget):
+  # the conditional GET fingerprint, the venue and its shows
+  with query_budget(3):
+    response = client.get(f"/venues/{catalogue['venue_id']}")
+  assert response.status_code == 200
+  assert 'Matt Quevedo' in response.get_data(as_text=True)
+
+
+def test_artist(client, catalogue, query_budget):
+  with query_budget(3):
+    response = client.get(f"/artists/{catalogue['artist_id']}")
+  assert response.status_code == 200
+  assert 'Park Square Live Music' in response.get_data(as_text=True)
+
+
+def test_search_venues(client, catalogue, query_budget):
+  with query_budget(1):
+    response = client.post('/venues/search', data={'search_term': 'music'})
+  assert response.status_code == 200
+  assert 'The Musical Hop' in response.get_data(as_text=True)
+  assert 'The Dueling Pianos Bar' not in response.get_data(as_text=True)
+
+
+def test_search_artists(client, catalogue, query_budget):
+  with query_budget(1):
+    response = client.post('/artists/search', data={'search_term': 'A'})
+  assert response.status_code == 200
+  body = response.get_data(as_text=True)
+  assert all(name in body for name in ('Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band'))
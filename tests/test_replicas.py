@@ -0,0 +1,57 @@
+import pytest
+
+from app import create_app
+from config import TestingConfig
+from models import db, Venue
+from replicas import STICKY_COOKIE
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#
+# A SQLite file standing in for both the primary and its replica: only which
+# requests make the client stick to the primary is checked here.
+#----------------------------------------------------------------------------#
+
+@pytest.fixture
+def replicated(app, tmp_path):
+  with app.app_context():
+    if db.engine.dialect.name != 'sqlite':
+      pytest.skip('runs on the SQLite stand-in')
+
+  class ReplicatedConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "fyyur.db"}'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_REPLICA_URIS = [SQLALCHEMY_DATABASE_URI]
+
+  replicated = create_app(ReplicatedConfig)
+  with replicated.app_context():
+    db.create_all(bind=None)
+  return replicated
+
+
+def sticky(response):
+  return any(header.startswith(STICKY_COOKIE + '=') for header in response.headers.getlist('Set-Cookie'))
+
+
+def test_search_does_not_stick_to_the_primary(replicated):
+  client = replicated.test_client()
+  # the navbar searches with GET, a POST (an older page) reads from the primary
+  for response in client.get('/venues/search?search_term=hop'), client.post('/venues/search', data={'search_term': 'hop'}):
+    assert response.status_code == 200
+    assert not sticky(response)
+
+
+def test_only_writes_stick_to_the_primary(replicated):
+  client = replicated.test_client()
+  venue = {'name': 'The Musical Hop', 'city': 'SanFrancisco', 'state': 'CA', 'address': '1015 Folsom Street',
+           'phone': '4150000000', 'genres': 'Jazz', 'facebook_link': ''}
+
+  rejected = client.post('/venues/create', data=dict(venue, phone='not a number'))
+  assert rejected.status_code == 200
+  assert not sticky(rejected)
+
+  created = client.post('/venues/create', data=venue)
+  assert created.status_code == 200
+  assert sticky(created)
+  with replicated.app_context():
+    assert Venue.query.count() == 1
@@ -0,0 +1,9 @@
+from app import highlight, HEADLINE_START, HEADLINE_STOP
+
+#----------------------------------------------------------------------------#
+# Full text search.
+#----------------------------------------------------------------------------#
+
+def test_highlight_escapes_the_data():
+  headline = f'Rock «n» Roll <b>&</b> {HEADLINE_START}Jazz{HEADLINE_STOP}'
+  assert highlight(headline) == 'Rock «n» Roll &lt;b&gt;&amp;&lt;/b&gt; <mark>Jazz</mark>'
@@ -0,0 +1,13 @@
+#----------------------------------------------------------------------------#
+# Streamed pages.
+#----------------------------------------------------------------------------#
+
+FLASH = 'Venue with ID 999999 does not exist'
+
+
+def test_streamed_page_consumes_flashes(client):
+  # the session cookie goes out before a streamed body is rendered, the flashes
+  # it shows must be gone from the session by then
+  assert client.get('/venues/999999').status_code == 302
+  assert FLASH in client.get('/venues').get_data(as_text=True)
+  assert FLASH not in client.get('/artists').get_data(as_text=True)